@@ -0,0 +1,363 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import helper
+import parse_cache
+import preprocessor
+import timelines
+from diagnostics import stage
+
+OVERALL = 'Overall'
+
+# every aggregate the dashboard and the pdf draw, as the columns it groups by
+AGGREGATES = {
+    'weekday': ['day_name'],
+    'month': ['month'],
+}
+
+
+class AnalyticsIndex:
+    """per-user row positions and message counts, built once after parsing.
+
+    helper functions filter the whole frame with df[df['user'] == selected_user]
+    and aggregate again on every call. this does one groupby per aggregate for all
+    users up front, so switching the selected user is a lookup into small tables.
+    lookups return the same shapes as the matching helper functions.
+
+    state / state_rows: counters stored from an earlier index (see state()) over
+    the first state_rows rows of df. only the rows after them get tokenized.
+    """
+
+    def __init__(self, df, link_mode='urlextract', state=None, state_rows=0):
+        self.df = df.reset_index(drop=True)
+        self.link_mode = link_mode
+        self._state = dict(state or {}) if 0 < state_rows <= len(self.df) else {}
+        self._state_rows = state_rows if self._state else 0
+        # set by open_chat(), for save_chat()
+        self.cache_key = None
+        self.saved = set()
+        # selected user -> ChatAnalysis, see chat_analysis.analysis_of()
+        self.analyses = {}
+        # the index is shared by every session showing the chat (and the pdf thread),
+        # so each lazy counter is computed under this lock and assigned once, complete
+        self._lock = threading.Lock()
+
+        # row positions per user: one stable argsort instead of a boolean scan per user
+        codes, users = pd.factorize(self.df['user'], sort=True)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.cumsum(np.bincount(codes, minlength=len(users)))[:-1]
+        self.positions = dict(zip(users, np.split(order, bounds)))
+        self.user_codes = {user: code for code, user in enumerate(users)}
+
+        # messages per user x weekday x hour, one bincount over integer codes; both
+        # activity heatmaps are slices of it. rows without a parsed date are left out
+        dates = self.df['date']
+        dated = dates.notna().to_numpy()
+        flat = (codes[dated] * 7 + dates.dt.dayofweek.to_numpy()[dated].astype('int64')) * 24 \
+            + dates.dt.hour.to_numpy()[dated].astype('int64')
+        self.cube = np.bincount(flat, minlength=len(users) * 7 * 24).reshape(len(users), 7, 24)
+        # day ordinal of every row, the timelines bucket these
+        self.days = timelines.day_ordinals(dates)
+
+        # message counts keyed by (user, *group columns), plus the same summed over users
+        self.counts = {}
+        self.overall = {}
+        for name, keys in AGGREGATES.items():
+            counts = self.df.groupby(['user'] + keys, observed=True).size()
+            self.counts[name] = counts
+            self.overall[name] = counts.groupby(level=keys, observed=True).sum()
+
+        self._views = {}
+        self._word_counts = None
+        self._media = None
+        self._terms = None
+        self._links = None
+        self._emojis = None
+        self._conversation = None
+
+    def users(self):
+        """dropdown entries: 'Overall' then participants sorted, without group_notification"""
+        names = sorted(u for u in self.positions if u != 'group_notification')
+        return [OVERALL] + names
+
+    def rows(self, selected_user):
+        """the messages of selected_user (all messages for 'Overall')"""
+        if selected_user == OVERALL:
+            return self.df
+        positions = self.positions.get(selected_user)
+        if positions is None:
+            return self.df.iloc[:0]
+        return self.df.iloc[positions]
+
+    def message_count(self, selected_user):
+        if selected_user == OVERALL:
+            return len(self.df)
+        return len(self.positions.get(selected_user, ()))
+
+    def _select(self, values, selected_user):
+        # per-message array restricted to selected_user
+        if selected_user == OVERALL:
+            return values
+        return values[self.positions.get(selected_user, np.empty(0, dtype=np.intp))]
+
+    def _new_rows(self, *names):
+        # the rows still to compute, and the stored values of names (None if missing)
+        stored = [self._state.get(name) for name in names]
+        if any(s is None for s in stored):
+            return self.df, [None] * len(names)
+        return self.df.iloc[self._state_rows:], stored
+
+    def _tokenize(self):
+        # one tokenization pass per chat, shared by the stats, top words and word cloud.
+        # _terms is assigned last, it is what tells the counters are there
+        if self._terms is not None:
+            return
+        with self._lock:
+            if self._terms is not None:
+                return
+            rows, (words, media, terms) = self._new_rows('word_counts', 'media', 'terms')
+            with stage('tokenize', rows=len(rows)):
+                counts, new_terms = helper.tokenize(rows)
+                word_counts = _append(words, counts)
+                media_mask = _append(media, helper.media_mask(rows['message']))
+                if terms is not None:
+                    new_terms = helper.merge_frequencies(terms, new_terms)
+            self._word_counts = word_counts
+            self._media = media_mask
+            self._terms = new_terms
+
+    def word_count(self, selected_user):
+        self._tokenize()
+        return int(self._select(self._word_counts, selected_user).sum())
+
+    def media_count(self, selected_user):
+        self._tokenize()
+        return int(self._select(self._media, selected_user).sum())
+
+    def _count_links(self):
+        # urls per message are found once for the whole chat, then summed per user
+        if self._links is not None:
+            return
+        with self._lock:
+            if self._links is not None:
+                return
+            rows, (links,) = self._new_rows(f'links-{self.link_mode}')
+            with stage('links', rows=len(rows)):
+                self._links = _append(links, helper.link_counts(rows['message'], self.link_mode))
+
+    def link_count(self, selected_user):
+        self._count_links()
+        return int(self._select(self._links, selected_user).sum())
+
+    def fetch_stats(self, selected_user):
+        """same tuple as helper.fetch_stats: (messages, words, media, links)"""
+        return (
+            self.message_count(selected_user),
+            self.word_count(selected_user),
+            self.media_count(selected_user),
+            self.link_count(selected_user),
+        )
+
+    def word_frequencies(self, selected_user):
+        """stop word filtered word -> count series for selected_user"""
+        key = ('words', selected_user)
+        if key not in self._views:
+            self._tokenize()
+            self._views[key] = helper.user_frequencies(selected_user, self._terms)
+        return self._views[key]
+
+    def most_common_words(self, selected_user):
+        return helper.top_words(self.word_frequencies(selected_user))
+
+    def create_wordcloud(self, selected_user, size=helper.WORDCLOUD_FULL):
+        """word cloud image of selected_user, drawn once per size"""
+        key = ('wordcloud', selected_user, size)
+        if key not in self._views:
+            self._views[key] = helper.wordcloud_from_frequencies(self.word_frequencies(selected_user), size)
+        return self._views[key]
+
+    def _count_emojis(self):
+        if self._emojis is not None:
+            return
+        with self._lock:
+            if self._emojis is not None:
+                return
+            rows, (emojis,) = self._new_rows('emojis')
+            with stage('emojis', rows=len(rows)):
+                counts = helper.emoji_frequencies(rows)
+                if emojis is not None:
+                    counts = helper.merge_frequencies(emojis, counts)
+            self._emojis = counts
+
+    def emoji_frequencies(self, selected_user):
+        """emoji -> count series for selected_user"""
+        key = ('emojis', selected_user)
+        if key not in self._views:
+            self._count_emojis()
+            self._views[key] = helper.user_frequencies(selected_user, self._emojis)
+        return self._views[key]
+
+    def emoji_helper(self, selected_user):
+        return helper.top_emojis(self.emoji_frequencies(selected_user))
+
+    def conversation(self):
+        """helper.conversation_frame() of the whole chat; the reply and session
+        metrics of every user are read from it"""
+        if self._conversation is None:
+            with self._lock:
+                if self._conversation is None:
+                    with stage('conversation', rows=len(self.df)):
+                        self._conversation = helper.conversation_frame(self.df)
+        return self._conversation
+
+    def state(self):
+        """{name: series} of the per-message and per-user counters computed so far,
+        all covering every row of df; parse_cache.store_state() writes these"""
+        state = {}
+        if self._terms is not None:
+            state['word_counts'] = pd.Series(self._word_counts)
+            state['media'] = pd.Series(self._media)
+            state['terms'] = self._terms
+        if self._links is not None:
+            state[f'links-{self.link_mode}'] = pd.Series(self._links)
+        if self._emojis is not None:
+            state['emojis'] = self._emojis
+        return state
+
+    def aggregate(self, name, selected_user):
+        """raw counts series of one aggregate for selected_user"""
+        if selected_user == OVERALL:
+            return self.overall[name]
+        counts = self.counts[name]
+        if selected_user not in self.positions:
+            return counts.iloc[:0].droplevel(0)
+        return counts.xs(selected_user, level=0)
+
+    def _view(self, name, selected_user, build):
+        # shaped results are memoized, so flipping back to a user is a dict hit
+        key = (name, selected_user)
+        if key not in self._views:
+            self._views[key] = build(self.aggregate(name, selected_user))
+        return self._views[key]
+
+    def timeline(self, selected_user, freq='M', fill=True):
+        """messages of selected_user per day / week / month / quarter (freq D / W / M /
+        Q): columns bucket, start, time (label), message. fill=True zero-fills gaps"""
+        key = ('timeline', selected_user, freq, fill)
+        if key not in self._views:
+            days = self._select(self.days, selected_user)
+            self._views[key] = timelines.count_timeline(days, freq, fill)
+        return self._views[key]
+
+    def lod_timeline(self, selected_user, width_px):
+        """(freq, timeline) of selected_user sized for a chart width_px wide, see
+        timelines.lod_timeline"""
+        key = ('lod', selected_user, width_px)
+        if key not in self._views:
+            self._views[key] = timelines.lod_timeline(self._select(self.days, selected_user), width_px)
+        return self._views[key]
+
+    def monthly_timeline(self, selected_user):
+        """helper.monthly_timeline layout, months without messages included as 0"""
+        key = ('monthly', selected_user)
+        if key not in self._views:
+            self._views[key] = timelines.monthly_layout(self.timeline(selected_user, 'M'))
+        return self._views[key]
+
+    def daily_timeline(self, selected_user):
+        """helper.daily_timeline layout, days without messages included as 0"""
+        key = ('daily', selected_user)
+        if key not in self._views:
+            self._views[key] = timelines.daily_layout(self.timeline(selected_user, 'D'))
+        return self._views[key]
+
+    def week_activity_map(self, selected_user):
+        return self._view('weekday', selected_user, _most_common_first)
+
+    def month_activity_map(self, selected_user):
+        return self._view('month', selected_user, _most_common_first)
+
+    def activity_cube(self, selected_user):
+        """7 x 24 weekday x hour message counts of selected_user"""
+        if selected_user == OVERALL:
+            return self.cube.sum(axis=0)
+        code = self.user_codes.get(selected_user)
+        return np.zeros((7, 24), dtype=self.cube.dtype) if code is None else self.cube[code]
+
+    def activity_heatmap(self, selected_user):
+        """weekday x period counts (the helper pivot_table), from the cube"""
+        key = ('heatmap', selected_user)
+        if key not in self._views:
+            grid = pd.DataFrame(self.activity_cube(selected_user),
+                                index=pd.Index(preprocessor.DAY_NAMES, name='day_name'),
+                                columns=pd.Index(preprocessor.PERIODS, name='period'))
+            # only the days and periods that have messages, like pivot_table
+            self._views[key] = grid.loc[grid.any(axis=1), grid.any(axis=0)]
+        return self._views[key]
+
+    def time_activity_user_grid(self, selected_user, top_k=None):
+        """long user / day_name / hour / count frame for the altair facet: every day x
+        hour of each user. for 'Overall' that is every user, or the top_k users by
+        message count"""
+        key = ('grid', selected_user, top_k)
+        if key not in self._views:
+            if selected_user == OVERALL:
+                totals = self.cube.sum(axis=(1, 2))
+                users = np.flatnonzero(totals)
+                if top_k is not None and len(users) > top_k:
+                    # top_k by messages, kept in name order
+                    users = np.sort(users[np.argsort(-totals[users], kind='stable')[:top_k]])
+            else:
+                code = self.user_codes.get(selected_user)
+                users = [] if code is None or not self.cube[code].any() else [code]
+            users = np.asarray(users, dtype=np.intp)
+            names = np.array(list(self.user_codes), dtype=object)
+            self._views[key] = pd.DataFrame({
+                'user': np.repeat(names[users], 7 * 24),
+                'day_name': pd.Categorical.from_codes(np.tile(np.repeat(np.arange(7), 24), len(users)),
+                                                      categories=preprocessor.DAY_NAMES, ordered=True),
+                'hour': np.tile(np.arange(24), 7 * len(users)),
+                'count': self.cube[users].reshape(-1),
+            })
+        return self._views[key]
+
+
+def _append(stored, values):
+    # per-message values: the stored ones of the first rows, then the new ones
+    values = values.to_numpy()
+    return values if stored is None else np.concatenate([stored.to_numpy(), values])
+
+
+def _most_common_first(counts):
+    """value_counts() layout: highest count first, series named 'count'"""
+    counts = counts[counts > 0].sort_values(ascending=False, kind='stable')
+    return counts.rename('count')
+
+
+def open_chat(path, key=None, compact=False, workers=None, link_mode='urlextract'):
+    """AnalyticsIndex of a chat file through the parse cache. a chat opened before
+    comes back with its counters; a longer re-export of it only parses and counts
+    the messages added since"""
+    if key is None:
+        key = parse_cache.file_hash(path)
+    df = parse_cache.cached_preprocess_file(path, key, compact=compact, workers=workers)
+    entry = parse_cache.cache_key(key, compact)
+    rows, state = parse_cache.load_state(entry)
+    with stage('index build', rows=len(df)):
+        index = AnalyticsIndex(df, link_mode, state, rows)
+    index.cache_key = entry
+    if rows == len(index.df):
+        index.saved = set(state)
+    return index
+
+
+def save_chat(index):
+    """store the counters an open_chat() index computed since it was opened"""
+    state = index.state()
+    new = state.keys() - index.saved
+    if index.cache_key is not None and new:
+        # the counters saved before cover the same rows, only the new ones are written
+        parse_cache.store_state(index.cache_key, {name: state[name] for name in new}, len(index.df))
+        index.saved = set(state)
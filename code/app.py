@@ -1,16 +1,18 @@
 import streamlit as st
-import preprocessor,helper
+import diagnostics,helper,parse_cache,report,timelines
+from analytics_index import open_chat, save_chat
+from chat_analysis import analysis_of
 import matplotlib.pyplot as plt
 import seaborn as sns
 import altair as alt
-from io import BytesIO
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, PageBreak, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-from reportlab.lib.utils import ImageReader
 import tempfile
+import os
 import pandas as pd
+import logging
+
+# CHATLYTICS_LOG_LEVEL=DEBUG logs every parse / aggregate stage with its timing
+diagnostics.configure_logging()
+logger = logging.getLogger('app')
 
 # small helper: show table rows starting from 1 (looks cleaner to me)
 def df_1based(df: pd.DataFrame) -> pd.DataFrame:
@@ -18,6 +20,33 @@ def df_1based(df: pd.DataFrame) -> pd.DataFrame:
     d.index = range(1, len(d) + 1)
     return d
 
+# parsed chats are shared by all sessions of this server, keyed by the upload's
+# content hash, so the same export is a lookup. the per-user results live on the
+# chat's index and go with it; entry count and ttl keep a busy server bounded
+CACHE_TTL = int(os.environ.get('CHATLYTICS_CACHE_TTL', 3600))  # seconds
+MAX_CACHED_CHATS = 8
+
+# participants drawn by default in the overall activity facet, one chart row each
+GRID_TOP_K = 10
+
+# the timeline figures are 8 inches at 100 dpi
+TIMELINE_WIDTH_PX = 800
+
+@st.cache_resource(max_entries=MAX_CACHED_CHATS, ttl=CACHE_TTL, show_spinner="Parsing chat...")
+def load_chat_index(chat_key, _upload, _chat_path=None):
+    """AnalyticsIndex of a chat. pass the spooled file if there is one already,
+    otherwise the upload is spooled again (only after the entry expired)"""
+    spooled = _chat_path is None
+    if spooled:
+        _upload.seek(0)
+        _chat_path, _ = parse_cache.spool(_upload)
+    try:
+        # a re-export of a chat seen before only parses and counts its new messages
+        return open_chat(_chat_path, chat_key, compact=True, workers=os.cpu_count())
+    finally:
+        if spooled:
+            os.remove(_chat_path)
+
 st.set_page_config(page_title="CHATLYTICS", layout="wide")
 
 def load_css():
@@ -70,17 +99,24 @@ st.markdown("""
 # user brings the exported whatsapp .txt here
 uploaded_file = st.file_uploader("Upload exported chat (.txt)", help="Export a chat from WhatsApp and upload the .txt file here")
 if uploaded_file is not None:
-    # read bytes and parse to dataframe
-    bytes_data = uploaded_file.getvalue()
-    data = bytes_data.decode("utf-8")
-    df = preprocessor.preprocess(data)
+    # spool the upload to a temp file once to get its content hash, then parse it
+    # memory-mapped (or take the parse from the caches); per-user aggregates are built
+    # once per chat, so changing the dropdown only looks things up
+    upload_id = getattr(uploaded_file, 'file_id', uploaded_file.name)
+    if st.session_state.get('upload_id') != upload_id:
+        uploaded_file.seek(0)
+        chat_path, chat_key = parse_cache.spool(uploaded_file)
+        try:
+            load_chat_index(chat_key, uploaded_file, chat_path)
+        finally:
+            os.remove(chat_path)
+        st.session_state.upload_id = upload_id
+        st.session_state.chat_key = chat_key
+    chat_key = st.session_state.chat_key
+    index = load_chat_index(chat_key, uploaded_file)
 
     # build list of participants for dropdown
-    user_list = df['user'].unique().tolist()
-    if 'group_notification' in user_list:
-        user_list.remove('group_notification')
-    user_list.sort()
-    user_list.insert(0,"Overall")
+    user_list = index.users()
 
     # keep dropdown and button aligned on same line
     col_sel, col_btn = st.columns([3,1], vertical_alignment="bottom")
@@ -98,409 +134,334 @@ if uploaded_file is not None:
     
     if should_analyze:
         st.session_state.last_analyzed_user = selected_user
-        
+        # everything below (tabs and pdf) reads from this, each metric computed once
+        analysis = analysis_of(index, selected_user)
         
         st.markdown("<h2 class='section-title'>Overview</h2>", unsafe_allow_html=True)
 
-        # main sections of the app
-        tab_overview, tab_timeline, tab_activity, tab_users, tab_words, tab_emojis = st.tabs([
-            "Overview", "Timeline", "Activity", "Users", "Words", "Emojis"
-        ])
+        # main sections of the app. switching tabs reruns the script and only the open
+        # tab computes and draws its part; the analysis keeps what it computed, so
+        # coming back to a tab (or building the pdf) reuses it
+        tab_overview, tab_timeline, tab_activity, tab_users, tab_words, tab_emojis, tab_conversations = st.tabs([
+            "Overview", "Timeline", "Activity", "Users", "Words", "Emojis", "Conversations"
+        ], key='tab', on_change='rerun')
 
-        num_messages, words, num_media_messages, num_links = helper.fetch_stats(selected_user,df)
         with tab_overview:
-            c1, c2, c3, c4 = st.columns(4)
-            with c1:
-                st.markdown("<div class='metric-card'><div class='metric-label'>💬 Messages</div><div class='metric-value'>"+str(num_messages)+"</div></div>", unsafe_allow_html=True)
-            with c2:
-                st.markdown("<div class='metric-card'><div class='metric-label'>📝 Words</div><div class='metric-value'>"+str(words)+"</div></div>", unsafe_allow_html=True)
-            with c3:
-                st.markdown("<div class='metric-card'><div class='metric-label'>🖼️ Media</div><div class='metric-value'>"+str(num_media_messages)+"</div></div>", unsafe_allow_html=True)
-            with c4:
-                st.markdown("<div class='metric-card'><div class='metric-label'>🔗 Links</div><div class='metric-value'>"+str(num_links)+"</div></div>", unsafe_allow_html=True)
+            if tab_overview.open:
+                num_messages, words, num_media_messages, num_links = analysis.fetch_stats()
+                c1, c2, c3, c4 = st.columns(4)
+                with c1:
+                    st.markdown("<div class='metric-card'><div class='metric-label'>💬 Messages</div><div class='metric-value'>"+str(num_messages)+"</div></div>", unsafe_allow_html=True)
+                with c2:
+                    st.markdown("<div class='metric-card'><div class='metric-label'>📝 Words</div><div class='metric-value'>"+str(words)+"</div></div>", unsafe_allow_html=True)
+                with c3:
+                    st.markdown("<div class='metric-card'><div class='metric-label'>🖼️ Media</div><div class='metric-value'>"+str(num_media_messages)+"</div></div>", unsafe_allow_html=True)
+                with c4:
+                    st.markdown("<div class='metric-card'><div class='metric-label'>🔗 Links</div><div class='metric-value'>"+str(num_links)+"</div></div>", unsafe_allow_html=True)
 
         with tab_timeline:
-            st.markdown("<h3 class='section-title'>Timeline</h3>", unsafe_allow_html=True)
-            col_left, col_right = st.columns(2)
-            with col_left:
-                timeline = helper.monthly_timeline(selected_user, df)
-                if timeline is not None and not timeline.empty:
-                    fig, ax = plt.subplots(figsize=(8, 5))
-                    ax.plot(timeline['time'], timeline['message'], color='#22c55e', linewidth=1.6)
-                    plt.xticks(rotation='vertical')
-                    plt.tight_layout()
-                    st.pyplot(fig, width='stretch')
-                else:
-                    st.info("No monthly activity to display.")
+            if tab_timeline.open:
+                st.markdown("<h3 class='section-title'>Timeline</h3>", unsafe_allow_html=True)
+                col_left, col_right = st.columns(2)
+                with col_left:
+                    timeline = analysis.monthly_timeline()
+                    if timeline is not None and not timeline.empty:
+                        fig, ax = plt.subplots(figsize=(8, 5))
+                        ax.plot(timeline['time'], timeline['message'], color='#22c55e', linewidth=1.6)
+                        report.bound_ticks(ax)
+                        plt.xticks(rotation='vertical')
+                        plt.tight_layout()
+                        st.pyplot(fig, width='stretch')
+                    else:
+                        st.info("No monthly activity to display.")
             
-            with col_right:
-                daily_timeline = helper.daily_timeline(selected_user, df)
-                if daily_timeline is not None and not daily_timeline.empty:
-                    fig, ax = plt.subplots(figsize=(8, 5))
-                    ax.plot(daily_timeline['only_date'], daily_timeline['message'], color='#a78bfa', linewidth=1.6)
-                    plt.xticks(rotation='vertical')
-                    plt.tight_layout()
-                    st.pyplot(fig, width='stretch')
-                else:
-                    st.info("No daily activity to display.")
+                with col_right:
+                    # days, or weeks / months once a long chat has more days than fit the chart
+                    freq, daily_timeline = analysis.lod_timeline(TIMELINE_WIDTH_PX)
+                    if not daily_timeline.empty:
+                        fig, ax = plt.subplots(figsize=(8, 5))
+                        ax.plot(daily_timeline['start'], daily_timeline['message'], color='#a78bfa', linewidth=1.6)
+                        ax.set_title(f"{timelines.FREQ_LABELS[freq]} messages")
+                        report.bound_ticks(ax, dates=True)
+                        plt.tight_layout()
+                        st.pyplot(fig, width='stretch')
+                    else:
+                        st.info("No daily activity to display.")
 
         with tab_activity:
-            st.markdown("<h3 class='section-title'>Activity</h3>", unsafe_allow_html=True)
-            col1,col2 = st.columns(2)
-            with col1:
-                st.subheader("Most Busy Day")
-                busy_day = helper.week_activity_map(selected_user,df)
-                if busy_day is not None and not busy_day.empty:
-                    fig,ax = plt.subplots(figsize=(6,3.2))
-                    ax.bar(busy_day.index,busy_day.values,color='#f59e0b')
-                    plt.xticks(rotation='vertical')
+            if tab_activity.open:
+                st.markdown("<h3 class='section-title'>Activity</h3>", unsafe_allow_html=True)
+                col1,col2 = st.columns(2)
+                with col1:
+                    st.subheader("Most Busy Day")
+                    busy_day = analysis.week_activity_map()
+                    if busy_day is not None and not busy_day.empty:
+                        fig,ax = plt.subplots(figsize=(6,3.2))
+                        ax.bar(busy_day.index,busy_day.values,color='#f59e0b')
+                        plt.xticks(rotation='vertical')
+                        st.pyplot(fig, width='stretch')
+                    else:
+                        st.info("No weekly activity to display.")
+                with col2:
+                    st.subheader("Most Busy Month")
+                    busy_month = analysis.month_activity_map()
+                    if busy_month is not None and not busy_month.empty:
+                        fig, ax = plt.subplots(figsize=(6,3.2))
+                        ax.bar(busy_month.index, busy_month.values,color='#38bdf8')
+                        plt.xticks(rotation='vertical')
+                        st.pyplot(fig, width='stretch')
+                    else:
+                        st.info("No monthly activity breakdown to display.")
+
+                st.subheader("Weekly Activity Map")
+                user_heatmap = analysis.activity_heatmap()
+                if user_heatmap is not None and not user_heatmap.empty:
+                    fig,ax = plt.subplots(figsize=(6.5,3.6))
+                    ax = sns.heatmap(user_heatmap, cmap="mako", cbar_kws={"label": "Messages"})
+                    ax.set_xlabel("Hour Period")
+                    ax.set_ylabel("Day of Week")
                     st.pyplot(fig, width='stretch')
                 else:
-                    st.info("No weekly activity to display.")
-            with col2:
-                st.subheader("Most Busy Month")
-                busy_month = helper.month_activity_map(selected_user, df)
-                if busy_month is not None and not busy_month.empty:
-                    fig, ax = plt.subplots(figsize=(6,3.2))
-                    ax.bar(busy_month.index, busy_month.values,color='#38bdf8')
-                    plt.xticks(rotation='vertical')
-                    st.pyplot(fig, width='stretch')
+                    st.info("No heatmap data to display.")
+
+                st.subheader("Time-based Activity Heatmap by Participant")
+                top_k = None
+                participants = len(user_list) - 1
+                if selected_user == 'Overall' and participants > GRID_TOP_K:
+                    top_k = st.slider("Most active participants shown", 1, participants, GRID_TOP_K)
+                grid_df = analysis.time_activity_user_grid(top_k)
+                if grid_df is not None and not grid_df.empty:
+                    base = alt.Chart(grid_df)
+
+                    heat = base.mark_rect().encode(
+                        x=alt.X('hour:O', title='Hour of Day'),
+                        y=alt.Y('day_name:O', sort=['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday'], title='Day of Week'),
+                        color=alt.Color('count:Q', scale=alt.Scale(scheme='inferno'), title='Messages'),
+                        tooltip=[
+                            alt.Tooltip('user:N', title='Participant'),
+                            alt.Tooltip('day_name:N', title='Day'),
+                            alt.Tooltip('hour:O', title='Hour'),
+                            alt.Tooltip('count:Q', title='Messages')
+                        ]
+                    ).properties(width=520, height=220)
+
+                    if selected_user == 'Overall':
+                        chart = heat.facet(
+                            row=alt.Row('user:N', title='Participant', header=alt.Header(labelAngle=0)),
+                        ).resolve_scale(color='shared')
+                    else:
+                        chart = heat.properties(title=f"{selected_user} — Messages by Day and Hour")
+
+                    st.altair_chart(chart.configure_axis(
+                        labelColor='#e2e8f0', titleColor='#e2e8f0'
+                    ).configure_legend(
+                        labelColor='#e2e8f0', titleColor='#e2e8f0'
+                    ))
                 else:
-                    st.info("No monthly activity breakdown to display.")
-
-            st.subheader("Weekly Activity Map")
-            user_heatmap = helper.activity_heatmap(selected_user,df)
-            if user_heatmap is not None and not user_heatmap.empty:
-                fig,ax = plt.subplots(figsize=(6.5,3.6))
-                ax = sns.heatmap(user_heatmap, cmap="mako", cbar_kws={"label": "Messages"})
-                ax.set_xlabel("Hour Period")
-                ax.set_ylabel("Day of Week")
-                st.pyplot(fig, width='stretch')
-            else:
-                st.info("No heatmap data to display.")
-
-            st.subheader("Time-based Activity Heatmap by Participant")
-            grid_df = helper.time_activity_user_grid(selected_user, df)
-            if grid_df is not None and not grid_df.empty:
-                base = alt.Chart(grid_df)
-
-                heat = base.mark_rect().encode(
-                    x=alt.X('hour:O', title='Hour of Day'),
-                    y=alt.Y('day_name:O', sort=['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday'], title='Day of Week'),
-                    color=alt.Color('count:Q', scale=alt.Scale(scheme='inferno'), title='Messages'),
-                    tooltip=[
-                        alt.Tooltip('user:N', title='Participant'),
-                        alt.Tooltip('day_name:N', title='Day'),
-                        alt.Tooltip('hour:O', title='Hour'),
-                        alt.Tooltip('count:Q', title='Messages')
-                    ]
-                ).properties(width=520, height=220)
+                    st.info("No time-based activity data to display.")
 
+        with tab_users:
+            if tab_users.open:
+                st.markdown("<h3 class='section-title'>Users</h3>", unsafe_allow_html=True)
                 if selected_user == 'Overall':
-                    chart = heat.facet(
-                        row=alt.Row('user:N', title='Participant', header=alt.Header(labelAngle=0)),
-                    ).resolve_scale(color='shared')
+                    x,new_df = analysis.most_busy_users()
+                    fig, ax = plt.subplots()
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        ax.bar(x.index, x.values,color='#ef4444')
+                        plt.xticks(rotation='vertical')
+                        st.pyplot(fig)
+                    with col2:
+                        st.dataframe(df_1based(new_df))
                 else:
-                    chart = heat.properties(title=f"{selected_user} — Messages by Day and Hour")
+                    st.info("Switch to 'Overall' to view most busy users.")
 
-                st.altair_chart(chart.configure_axis(
-                    labelColor='#e2e8f0', titleColor='#e2e8f0'
-                ).configure_legend(
-                    labelColor='#e2e8f0', titleColor='#e2e8f0'
-                ))
-            else:
-                st.info("No time-based activity data to display.")
+        with tab_words:
+            if tab_words.open:
+                st.markdown("<h3 class='section-title'>Words</h3>", unsafe_allow_html=True)
+                # small preview here, the pdf draws the full size one
+                df_wc = analysis.create_wordcloud(helper.WORDCLOUD_PREVIEW)
+                if df_wc is not None:
+                    fig,ax = plt.subplots(figsize=(6.5,3.8))
+                    ax.imshow(df_wc)
+                    ax.axis('off')
+                    st.pyplot(fig, width='content')
+                else:
+                    st.info("Not enough text to generate a wordcloud.")
 
-        with tab_users:
-            st.markdown("<h3 class='section-title'>Users</h3>", unsafe_allow_html=True)
-            if selected_user == 'Overall':
-                x,new_df = helper.most_busy_users(df)
-                fig, ax = plt.subplots()
-                col1, col2 = st.columns(2)
-                with col1:
-                    ax.bar(x.index, x.values,color='#ef4444')
+                most_common_df = analysis.most_common_words()
+                if most_common_df is not None and not most_common_df.empty:
+                    fig,ax = plt.subplots(figsize=(6.5,3.8))
+                    ax.barh(most_common_df[0],most_common_df[1], color="#60a5fa")
                     plt.xticks(rotation='vertical')
-                    st.pyplot(fig)
-                with col2:
-                    st.dataframe(df_1based(new_df))
-            else:
-                st.info("Switch to 'Overall' to view most busy users.")
-
-        with tab_words:
-            st.markdown("<h3 class='section-title'>Words</h3>", unsafe_allow_html=True)
-            df_wc = helper.create_wordcloud(selected_user,df)
-            if df_wc is not None:
-                fig,ax = plt.subplots(figsize=(6.5,3.8))
-                ax.imshow(df_wc)
-                ax.axis('off')
-                st.pyplot(fig, width='content')
-            else:
-                st.info("Not enough text to generate a wordcloud.")
-
-            most_common_df = helper.most_common_words(selected_user,df)
-            if most_common_df is not None and not most_common_df.empty:
-                fig,ax = plt.subplots(figsize=(6.5,3.8))
-                ax.barh(most_common_df[0],most_common_df[1], color="#60a5fa")
-                plt.xticks(rotation='vertical')
-                st.pyplot(fig, width='content')
-            else:
-                st.info("No common words to display.")
+                    st.pyplot(fig, width='content')
+                else:
+                    st.info("No common words to display.")
 
         # Emojis Tab
         with tab_emojis:
-            st.markdown("<h3 class='section-title'>Emojis</h3>", unsafe_allow_html=True)
-            emoji_df = helper.emoji_helper(selected_user,df)
-            if emoji_df is not None and not emoji_df.empty:
-                # Ensure proper column names
-                try:
-                    emoji_df.columns = ['emoji', 'count']
-                except Exception:
-                    pass
-
-                emoji_df = emoji_df.reset_index(drop=True)
-                display_df = (
-                    emoji_df[[ 'emoji', 'count' ]]
-                    .rename(columns={
-                        'emoji': 'emojis',
-                        'count': 'no of time occured'
-                    })
-                )
+            if tab_emojis.open:
+                st.markdown("<h3 class='section-title'>Emojis</h3>", unsafe_allow_html=True)
+                emoji_df = analysis.emoji_helper()
+                if emoji_df is not None and not emoji_df.empty:
+                    # Ensure proper column names (on a copy, the analysis result is shared with the pdf)
+                    emoji_df = emoji_df.set_axis(['emoji', 'count'], axis=1).reset_index(drop=True)
+                    display_df = (
+                        emoji_df[[ 'emoji', 'count' ]]
+                        .rename(columns={
+                            'emoji': 'emojis',
+                            'count': 'no of time occured'
+                        })
+                    )
+
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        st.dataframe(df_1based(display_df), height=520)
+                    with col2:
+                        top_n = 10 if len(emoji_df) >= 10 else len(emoji_df)
+                        top_df = emoji_df.head(top_n)
+                        if not top_df.empty and top_df['count'].sum() > 0:
+                            bar = (
+                                alt.Chart(top_df)
+                                  .mark_bar()
+                                  .encode(
+                                      y=alt.Y('emoji:N', sort='-x', title='Emojis'),
+                                      x=alt.X('count:Q', title='No. of times occurred'),
+                                      tooltip=[
+                                          alt.Tooltip('emoji:N', title='Emoji'),
+                                          alt.Tooltip('count:Q', title='Count')
+                                      ]
+                                  )
+                                  .properties(width=380, height=520)
+                            )
+                            text = (
+                                alt.Chart(top_df)
+                                  .mark_text(align='left', dx=3, color='#e2e8f0')
+                                  .encode(
+                                      y=alt.Y('emoji:N', sort='-x'),
+                                      x='count:Q',
+                                      text='count:Q'
+                                  )
+                            )
+                            st.altair_chart((bar + text).configure_axis(
+                                labelColor='#e2e8f0', titleColor='#e2e8f0'
+                            ).configure_legend(
+                                labelColor='#e2e8f0', titleColor='#e2e8f0'
+                            ))
+                        else:
+                            st.info("No emoji usage to chart.")
+                else:
+                    st.info("No emojis found in the selected conversation.")
+
+        # Conversations Tab: reply times, who answers whom, and who starts talking
+        with tab_conversations:
+            if tab_conversations.open:
+                st.markdown("<h3 class='section-title'>Conversations</h3>", unsafe_allow_html=True)
+                st.caption(f"A conversation ends after {int(helper.SESSION_GAP.total_seconds() // 60)} minutes of silence; "
+                           "a message right after someone else's in a conversation counts as a reply.")
+                latency = analysis.reply_latency()
+                median_reply = analysis.median_reply_minutes()
+                sessions = analysis.conversation_sessions()
+                initiators = analysis.day_initiators()
+
+                cards = [
+                    ("⏱️ Median Reply", "–" if median_reply is None else f"{median_reply:.1f} min"),
+                    ("↩️ Replies", str(int(latency['replies'].sum()))),
+                    ("🗨️ Conversations", str(len(sessions))),
+                    ("🌅 Days Started", str(int(initiators.sum()))),
+                ]
+                for col, (label, value) in zip(st.columns(4), cards):
+                    with col:
+                        st.markdown("<div class='metric-card'><div class='metric-label'>"+label+"</div><div class='metric-value'>"+value+"</div></div>", unsafe_allow_html=True)
 
                 col1, col2 = st.columns(2)
                 with col1:
-                    st.dataframe(df_1based(display_df), height=520)
+                    st.subheader("Median Reply Time")
+                    if not latency.empty:
+                        fig, ax = plt.subplots(figsize=(6, 3.6))
+                        top = latency.head(15).iloc[::-1]
+                        ax.barh(top['user'], top['median_minutes'], color='#22c55e')
+                        ax.set_xlabel("Minutes")
+                        st.pyplot(fig, width='stretch')
+                    else:
+                        st.info("No replies to time.")
                 with col2:
-                    top_n = 10 if len(emoji_df) >= 10 else len(emoji_df)
-                    top_df = emoji_df.head(top_n)
-                    if not top_df.empty and top_df['count'].sum() > 0:
-                        bar = (
-                            alt.Chart(top_df)
-                              .mark_bar()
-                              .encode(
-                                  y=alt.Y('emoji:N', sort='-x', title='Emojis'),
-                                  x=alt.X('count:Q', title='No. of times occurred'),
-                                  tooltip=[
-                                      alt.Tooltip('emoji:N', title='Emoji'),
-                                      alt.Tooltip('count:Q', title='Count')
-                                  ]
-                              )
-                              .properties(width=380, height=520)
-                        )
-                        text = (
-                            alt.Chart(top_df)
-                              .mark_text(align='left', dx=3, color='#e2e8f0')
-                              .encode(
-                                  y=alt.Y('emoji:N', sort='-x'),
-                                  x='count:Q',
-                                  text='count:Q'
-                              )
-                        )
-                        st.altair_chart((bar + text).configure_axis(
-                            labelColor='#e2e8f0', titleColor='#e2e8f0'
-                        ).configure_legend(
-                            labelColor='#e2e8f0', titleColor='#e2e8f0'
-                        ))
+                    st.subheader("First Message of the Day")
+                    if not initiators.empty:
+                        fig, ax = plt.subplots(figsize=(6, 3.6))
+                        top = initiators.head(15).iloc[::-1]
+                        ax.barh(top.index, top.values, color='#f59e0b')
+                        ax.set_xlabel("Days")
+                        st.pyplot(fig, width='stretch')
                     else:
-                        st.info("No emoji usage to chart.")
-            else:
-                st.info("No emojis found in the selected conversation.")
+                        st.info("No days to show.")
+
+                st.subheader("Who Replies to Whom")
+                edges = analysis.reply_edges()
+                if not edges.empty:
+                    if selected_user == 'Overall':
+                        # the most replying participants only, so the grid stays readable
+                        people = latency['user'].head(15)
+                        edges = edges[edges['user'].isin(people) & edges['replied_to'].isin(people)]
+                    chart = alt.Chart(edges).mark_rect().encode(
+                        x=alt.X('replied_to:N', title='Replied to'),
+                        y=alt.Y('user:N', title='Reply from'),
+                        color=alt.Color('replies:Q', scale=alt.Scale(scheme='inferno'), title='Replies'),
+                        tooltip=[
+                            alt.Tooltip('user:N', title='Reply from'),
+                            alt.Tooltip('replied_to:N', title='Replied to'),
+                            alt.Tooltip('replies:Q', title='Replies')
+                        ]
+                    ).properties(height=360)
+                    st.altair_chart(chart.configure_axis(
+                        labelColor='#e2e8f0', titleColor='#e2e8f0'
+                    ).configure_legend(
+                        labelColor='#e2e8f0', titleColor='#e2e8f0'
+                    ), width='stretch')
+                else:
+                    st.info("No replies found in the selected conversation.")
+
+                st.subheader("Longest Conversations")
+                if not sessions.empty:
+                    longest = sessions.nlargest(10, 'messages')
+                    longest = longest.assign(minutes=longest['minutes'].round(1))
+                    st.dataframe(df_1based(longest))
+                else:
+                    st.info("No conversations to show.")
 
         # Report Generation Section
-        # PDF Report area (we build PDF every render and show download button)
+        # PDF Report area: the report is only built when the download button is
+        # clicked; charts rendered for earlier downloads of this chat are reused
         st.markdown("<h3 class='section-title'>Report</h3>", unsafe_allow_html=True)
-        # Prepare filtered dataframe according to selected_user
-        if selected_user != 'Overall':
-            filtered_df = df[df['user'] == selected_user].copy()
-        else:
-            filtered_df = df.copy()
-
-        # Utility: convert matplotlib fig to reportlab image flowable
-        # turn matplotlib figure into ReportLab image (so we can put charts into PDF)
-        def fig_to_flowable(fig, max_width=480):
-            buf = BytesIO()
-            fig.savefig(buf, format='png', bbox_inches='tight', dpi=180)
-            plt.close(fig)
-            buf.seek(0)
-            # Pass the BytesIO buffer directly to ReportLab Image
-            rl_img = RLImage(buf)
-            # scale keeping aspect ratio
-            iw, ih = rl_img.drawWidth, rl_img.drawHeight
-            if iw > max_width:
-                scale = max_width / iw
-                rl_img.drawWidth = iw * scale
-                rl_img.drawHeight = ih * scale
-            return rl_img
-
-        # Compose report (built on each render to power direct download)
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=36, rightMargin=36, topMargin=36, bottomMargin=36)
-        styles = getSampleStyleSheet()
-        title_style = styles['Title']
-        h_style = styles['Heading2']
-        body = styles['BodyText']
-
-        flow = []
-
-        # Cover Page
-        chat_name = uploaded_file.name if uploaded_file is not None else 'WhatsApp Chat'
-        date_min = str(filtered_df['date'].min().date()) if not filtered_df.empty else '-'
-        date_max = str(filtered_df['date'].max().date()) if not filtered_df.empty else '-'
-        total_msgs = int(filtered_df.shape[0])
-
-        flow.append(Paragraph("CHATLYTICS Report", title_style))
-        flow.append(Spacer(1, 12))
-        flow.append(Paragraph(f"Chat: {chat_name}", body))
-        flow.append(Paragraph(f"Scope: {selected_user}", body))
-        flow.append(Paragraph(f"Date range: {date_min} to {date_max}", body))
-        flow.append(Paragraph(f"Total messages analyzed: {total_msgs}", body))
-        flow.append(Paragraph(f"Generated on: <u>{pd.Timestamp.now().strftime('%Y-%m-%d %H:%M')}</u>", body))
-        flow.append(PageBreak())
-
-        # Executive Summary (basic heuristics)
-        try:
-            busiest_day = filtered_df['day_name'].value_counts().idxmax() if not filtered_df.empty else '-'
-            busiest_user = filtered_df[filtered_df['user']!='group_notification']['user'].value_counts().idxmax() if not filtered_df.empty else '-'
-        except Exception:
-            busiest_day, busiest_user = '-', '-'
-        flow.append(Paragraph("Executive Summary", h_style))
-        flow.append(Paragraph(f"- Peak activity day: {busiest_day}", body))
-        flow.append(Paragraph(f"- Most frequent sender: {busiest_user}", body))
-        flow.append(Spacer(1, 12))
-
-        # Message Statistics chart
-        num_messages, words_count, num_media_messages, num_links = helper.fetch_stats(selected_user, df)
-        fig, ax = plt.subplots(figsize=(5, 3))
-        stats_labels = ['Messages', 'Words', 'Media', 'Links']
-        stats_values = [num_messages, words_count, num_media_messages, num_links]
-        ax.bar(stats_labels, stats_values, color=['#7c3aed','#2563eb','#22c55e','#f59e0b'])
-        ax.set_title('Message Statistics')
-        flow.append(fig_to_flowable(fig))
-        flow.append(Spacer(1, 6))
-
-        # Timeline charts
-        tl = helper.monthly_timeline(selected_user, df)
-        if tl is not None and not tl.empty:
-            fig, ax = plt.subplots(figsize=(6, 3.2))
-            ax.plot(tl['time'], tl['message'], color='#2563eb')
-            ax.set_title('Monthly Timeline')
-            ax.tick_params(axis='x', labelrotation=60)
-            flow.append(fig_to_flowable(fig))
-            flow.append(Spacer(1, 6))
-
-        dl = helper.daily_timeline(selected_user, df)
-        if dl is not None and not dl.empty:
-            fig, ax = plt.subplots(figsize=(6, 3.2))
-            ax.plot(dl['only_date'], dl['message'], color='#a78bfa')
-            ax.set_title('Daily Timeline')
-            fig.autofmt_xdate()
-            flow.append(fig_to_flowable(fig))
-            flow.append(Spacer(1, 6))
-
-        # Activity heatmap (day vs period)
-        hm = helper.activity_heatmap(selected_user, df)
-        if hm is not None and not hm.empty:
-            fig, ax = plt.subplots(figsize=(6, 3.2))
-            sns.heatmap(hm, cmap='mako', ax=ax, cbar_kws={'label':'Messages'})
-            ax.set_title('Weekly Activity Heatmap')
-            flow.append(fig_to_flowable(fig))
-            flow.append(Spacer(1, 6))
-
-        # Busy Day and Busy Month (bar charts)
-        bd = helper.week_activity_map(selected_user, df)
-        if bd is not None and not getattr(bd, 'empty', False):
-            fig, ax = plt.subplots(figsize=(5.5, 3.0))
-            ax.bar(bd.index, bd.values, color='#f59e0b')
-            ax.set_title('Most Busy Day')
-            ax.tick_params(axis='x', labelrotation=45)
-            flow.append(fig_to_flowable(fig))
-            flow.append(Spacer(1, 6))
-
-        bm = helper.month_activity_map(selected_user, df)
-        if bm is not None and not getattr(bm, 'empty', False):
-            fig, ax = plt.subplots(figsize=(5.5, 3.0))
-            ax.bar(bm.index, bm.values, color='#38bdf8')
-            ax.set_title('Most Busy Month')
-            ax.tick_params(axis='x', labelrotation=45)
-            flow.append(fig_to_flowable(fig))
-            flow.append(Spacer(1, 6))
-
-        # Most active participants (Overall only)
-        if selected_user == 'Overall':
-            x, new_df = helper.most_busy_users(df)
-            if not x.empty:
-                fig, ax = plt.subplots(figsize=(5.5, 3.2))
-                ax.bar(x.index, x.values, color='#ef4444')
-                ax.set_title('Most Active Participants')
-                ax.tick_params(axis='x', labelrotation=60)
-                flow.append(fig_to_flowable(fig))
-                flow.append(Spacer(1, 6))
-
-        # Top emojis
-        e_df = helper.emoji_helper(selected_user, df)
-        if e_df is not None and not e_df.empty:
-            try:
-                e_df.columns = ['emoji','count']
-            except Exception:
-                pass
-            top_e = e_df.head(10)
-            fig, ax = plt.subplots(figsize=(5, 3.2))
-            ax.barh(top_e['emoji'][::-1], top_e['count'][::-1], color='#60a5fa')
-            ax.set_title('Top Emojis')
-            flow.append(fig_to_flowable(fig))
-            flow.append(Spacer(1, 6))
-
-        # Most common words
-        mc_df = helper.most_common_words(selected_user, df)
-        if mc_df is not None and not mc_df.empty:
-            fig, ax = plt.subplots(figsize=(5.5, 3.2))
-            ax.barh(mc_df[0][::-1], mc_df[1][::-1], color='#22c55e')
-            ax.set_title('Most Common Words')
-            flow.append(fig_to_flowable(fig))
-            flow.append(PageBreak())
-
-        # Word Cloud
-        wc_img = helper.create_wordcloud(selected_user, df)
-        if wc_img is not None:
-            fig, ax = plt.subplots(figsize=(6.5, 3.8))
-            ax.imshow(wc_img)
-            ax.axis('off')
-            ax.set_title('Word Cloud')
-            flow.append(fig_to_flowable(fig))
-            flow.append(Spacer(1, 6))
-
-        # Appendix: Basic tables
-        flow.append(Paragraph('Appendix: Summary Tables', h_style))
-        # Summary metrics table
-        metrics_data = [
-            ['Metric', 'Value'],
-            ['Total Messages', str(total_msgs)],
-            ['Total Words', str(words_count)],
-            ['Media Messages', str(num_media_messages)],
-            ['Links Shared', str(num_links)],
-        ]
-        t = Table(metrics_data, hAlign='LEFT')
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.grey),
-            ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
-            ('GRID', (0,0), (-1,-1), 0.5, colors.lightgrey),
-            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-        ]))
-        flow.append(t)
-
-        # Build PDF and expose direct download button without separate generation step
-        try:
-            doc.build(flow)
-            buffer.seek(0)
-            file_name = f"chat_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M')}.pdf"
-            st.download_button(
-                label="Download Full Report as PDF",
-                data=buffer.getvalue(),
-                file_name=file_name,
-                mime="application/pdf"
-            )
-        except Exception as e:
-            st.error(f"Failed to generate PDF report: {e}")
+        chat_name = uploaded_file.name
+
+        def build_pdf():
+            pdf = report.build_report(analysis, chat_name, chat_key=chat_key)
+            logger.debug("analysis cache after report: %s", analysis.cache_stats())
+            return pdf
+
+        file_name = f"chat_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M')}.pdf"
+        st.download_button(
+            label="Download Full Report as PDF",
+            data=build_pdf,
+            file_name=file_name,
+            mime="application/pdf",
+            on_click="ignore"
+        )
+        logger.debug("analysis cache after render: %s", analysis.cache_stats())
+        # keep the word / emoji / link counters on disk for the next export of this chat
+        save_chat(index)
+
+        # stage timings of this server process and the metric cache of this view;
+        # counts and timings only, no chat content
+        if st.toggle("Show diagnostics", help="Timing, rows and peak memory of each parse and analysis stage"):
+            stages = pd.DataFrame.from_dict(diagnostics.stats(), orient='index')
+            stages.index.name = 'stage'
+            st.dataframe(stages, width='stretch')
+            st.caption("Peak memory is only measured with CHATLYTICS_TRACE_MEMORY=1.")
+            cache = pd.DataFrame.from_dict(analysis.cache_stats(), orient='index')
+            cache.index.name = 'metric'
+            st.dataframe(cache, width='stretch')
     else:
         st.markdown("<div class='empty-card'>Click 'Refresh Analysis' to generate insights for the selected user.</div>", unsafe_allow_html=True)
 else:
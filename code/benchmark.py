@@ -0,0 +1,240 @@
+"""benchmark of the parse and analysis stages on synthetic chats.
+
+    python code/benchmark.py --sizes 10k,100k,1M,5M --out benchmark.json
+
+every size x export format gets a generated chat (multi-line messages, media
+placeholders, urls, emojis, hinglish text) that is parsed and run through every
+dashboard metric in a fresh process. the json report has the time and row count of
+each stage plus the peak rss of the run; --trace-memory adds a second, traced run
+for the peak memory of each stage (tracemalloc makes that run much slower, so its
+timings are not reported). same seed, same chats, so reports of two commits compare.
+
+    python code/benchmark.py --generate chat.txt --sizes 100k --formats 4
+
+only writes a synthetic chat.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import diagnostics
+import helper
+import preprocessor
+from analytics_index import AnalyticsIndex, OVERALL
+from chat_analysis import ChatAnalysis
+
+NAMES = ['Rohan', 'Priya', 'Amit Kumar', 'Sneha', 'Rahul', 'Anjali', 'Vikram Singh', 'Pooja',
+         'Arjun', 'Neha', 'Karan', 'Divya', 'Sanjay P.', 'Meera', 'Aditya', 'Kavya']
+WORDS = ('kya hai nahi yaar acha chalo kal milte bhai scene mast paisa khana ghar office '
+         'late ho gaya kaha ho abhi aaja party movie match dekha bro sahi baat hai plan '
+         'kar lete weekend trip pe chalte hain exam padhai kab se ready tomorrow meeting '
+         'call karo please thanks okay done haan theek bas chill maza aaya photo bhejo').split()
+EMOJIS = ['😂', '❤️', '👍', '🙏', '😭', '🔥', '😍', '👍🏽', '🎉', '👨‍👩‍👧', '😅', '🤣']
+URLS = ['https://youtu.be/dQw4w9WgXcQ', 'https://www.instagram.com/p/abc123/', 'www.example.com/menu',
+        'https://maps.app.goo.gl/xyz', 'https://en.wikipedia.org/wiki/Chai']
+# share of each message kind
+KINDS = {'text': 0.62, 'emoji': 0.12, 'url': 0.05, 'media': 0.08, 'multiline': 0.08, 'notification': 0.05}
+# messages per hour of the day, quiet nights and busy evenings
+HOUR_WEIGHTS = np.array([2, 1, 1, 1, 1, 2, 3, 5, 7, 8, 8, 8, 9, 8, 7, 7, 8, 9, 10, 11, 12, 11, 8, 4], dtype=float)
+
+STAGE_METRICS = ['fetch_stats', 'monthly_timeline', 'daily_timeline', 'week_activity_map',
+                 'month_activity_map', 'activity_heatmap', 'most_busy_users', 'most_common_words',
+                 'emoji_helper']
+
+
+def parse_size(text):
+    """'10k' / '5M' / '2500' -> message count"""
+    text = text.strip()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1].lower(), 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def _stamps(days, minutes, seconds, fmt):
+    # timestamp prefix in the layout of preprocessor.patterns[fmt]
+    dates = (np.datetime64('2021-01-01') + days).astype(object)
+    hours, mins = divmod(minutes, 60)
+    out = []
+    for date, h, m, s in zip(dates, hours.tolist(), mins.tolist(), seconds.tolist()):
+        d, mo, y = date.day, date.month, date.year
+        if fmt == 0:
+            out.append(f"{d:02}/{mo:02}/{y}, {h:02}:{m:02} - ")
+        elif fmt == 1:
+            # android 12h export: no leading zeros, "am - " ahead of the name
+            out.append(f"{d}/{mo}/{y}, {(h - 1) % 12 + 1}:{m:02} {'am' if h < 12 else 'pm'} - ")
+        elif fmt == 2:
+            out.append(f"{d:02}-{mo:02}-{y}, {h:02}:{m:02} - ")
+        elif fmt == 3:
+            out.append(f"{d:02}.{mo:02}.{y}, {h:02}:{m:02} - ")
+        else:
+            out.append(f"[{d:02}/{mo:02}/{y}, {h:02}:{m:02}:{s:02}] ")
+    return out
+
+
+def _bodies(rng, users, kinds):
+    # "user: message" text of every message
+    n = len(kinds)
+    lengths = rng.integers(1, 13, n)
+    words = np.array(WORDS, dtype=object)[rng.integers(0, len(WORDS), (n, 12))]
+    emojis = np.array(EMOJIS, dtype=object)[rng.integers(0, len(EMOJIS), n)]
+    urls = np.array(URLS, dtype=object)[rng.integers(0, len(URLS), n)]
+    others = rng.permutation(users)
+    out = []
+    for i, (user, kind, length) in enumerate(zip(users, kinds, lengths.tolist())):
+        text = ' '.join(words[i, :length])
+        if kind == 'notification':
+            out.append(f"{user} added {others[i]}")
+            continue
+        if kind == 'emoji':
+            text = f"{text} {emojis[i]}{emojis[i - 1]}"
+        elif kind == 'url':
+            text = f"dekho {urls[i]} {text}"
+        elif kind == 'media':
+            text = '<Media omitted>'
+        elif kind == 'multiline':
+            text = f"{text}\n{' '.join(words[i, length:])}\n{emojis[i]}"
+        out.append(f"{user}: {text}")
+    return out
+
+
+def generate_chat(path, messages, fmt=0, users=12, days=365, seed=0, chunk=200_000):
+    """write a synthetic export of `messages` messages by `users` participants over
+    `days` days in timestamp format preprocessor.patterns[fmt]; returns its size in bytes"""
+    rng = np.random.default_rng(seed)
+    names = NAMES[:users] + [f"Friend {i}" for i in range(len(NAMES), users)]
+    # a few people write most of the messages
+    weights = 1 / np.arange(1, users + 1)
+    day = rng.integers(0, days, messages)
+    minute = rng.choice(24, messages, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum()) * 60 + rng.integers(0, 60, messages)
+    order = np.lexsort((minute, day))
+    day, minute = day[order], minute[order]
+    second = rng.integers(0, 60, messages)
+    who = np.array(names, dtype=object)[rng.choice(users, messages, p=weights / weights.sum())]
+    kinds = rng.choice(list(KINDS), messages, p=list(KINDS.values()))
+
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(''.join(_stamps(day[:1], minute[:1], second[:1], fmt))
+                + "Messages and calls are end-to-end encrypted. No one outside of this chat can read them.\n")
+        for start in range(0, messages, chunk):
+            part = slice(start, start + chunk)
+            stamps = _stamps(day[part], minute[part], second[part], fmt)
+            bodies = _bodies(rng, who[part], kinds[part])
+            f.write('\n'.join(s + b for s, b in zip(stamps, bodies)) + '\n')
+    return os.path.getsize(path)
+
+
+def run_stages(path, link_mode='urlextract', workers=None):
+    """parse a chat and compute every dashboard metric on it, like the app does;
+    returns the number of rows parsed"""
+    df = preprocessor.preprocess_file(path, compact=True, workers=workers)
+    with diagnostics.stage('index build', rows=len(df)):
+        index = AnalyticsIndex(df, link_mode)
+    analysis = ChatAnalysis(index, OVERALL)
+    for name in STAGE_METRICS:
+        getattr(analysis, name)()
+    analysis.lod_timeline(800)
+    analysis.time_activity_user_grid(10)
+    analysis.create_wordcloud(helper.WORDCLOUD_FULL)
+    return len(df)
+
+
+def measure(path, link_mode='urlextract', workers=None, trace_memory=False):
+    """one benchmark run in this (fresh) process: stage stats, rows, total time and
+    peak rss. with trace_memory, the stats come from a second, traced run"""
+    diagnostics.reset()
+    start = time.perf_counter()
+    rows = run_stages(path, link_mode, workers)
+    result = {
+        'rows': rows,
+        'total_seconds': time.perf_counter() - start,
+        # kilobytes on linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'stages': diagnostics.stats(),
+    }
+    if trace_memory:
+        diagnostics.reset()
+        diagnostics.trace_memory(True)
+        run_stages(path, link_mode, workers)
+        diagnostics.trace_memory(False)
+        for name, entry in diagnostics.stats().items():
+            result['stages'].setdefault(name, {})['peak_mb'] = entry['peak_mb']
+    return result
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark parsing and analysis on synthetic chats.")
+    parser.add_argument('--sizes', default='10k,100k,1M,5M', help="message counts (default: 10k,100k,1M,5M)")
+    parser.add_argument('--formats', default=','.join(map(str, range(len(preprocessor.patterns)))),
+                        help="timestamp formats, indexes into preprocessor.patterns (default: all)")
+    parser.add_argument('--users', type=int, default=12, help="participants per chat")
+    parser.add_argument('--days', type=int, default=730, help="days the chat spans")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--link-mode', choices=['urlextract', 'regex'], default='urlextract')
+    parser.add_argument('--workers', type=int, default=1, help="parse processes per chat (default: 1)")
+    parser.add_argument('--trace-memory', action='store_true', help="also measure peak memory per stage")
+    parser.add_argument('--out', default='benchmark.json', help="json report (default: benchmark.json)")
+    parser.add_argument('--generate', metavar='PATH', help="only write a chat of the first size and format")
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(s) for s in args.sizes.split(',')]
+    formats = [int(f) for f in args.formats.split(',')]
+    if args.generate:
+        generate_chat(args.generate, sizes[0], formats[0], args.users, args.days, args.seed)
+        print(f"wrote {args.generate}")
+        return 0
+
+    runs = []
+    # a fresh process per run, so lru caches, the allocator and the rss peak of one
+    # run do not leak into the next
+    with tempfile.TemporaryDirectory() as tmp, \
+            ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+        for messages in sizes:
+            for fmt in formats:
+                path = Path(tmp) / f"chat-{messages}-{fmt}.txt"
+                start = time.perf_counter()
+                size = pool.submit(generate_chat, path, messages, fmt, args.users, args.days, args.seed).result()
+                generated = time.perf_counter() - start
+                result = pool.submit(measure, path, args.link_mode, args.workers, args.trace_memory).result()
+                path.unlink()
+                runs.append({'messages': messages, 'format': fmt, 'file_mb': round(size / 2**20, 2),
+                             'generate_seconds': generated, **result})
+                print(f"{messages} messages, format {fmt}: {result['total_seconds']:.2f}s, "
+                      f"peak rss {result['peak_rss_mb']} MB")
+
+    report = {
+        'commit': _commit(),
+        'created': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'config': {'users': args.users, 'days': args.days, 'seed': args.seed,
+                   'link_mode': args.link_mode, 'workers': args.workers, 'trace_memory': args.trace_memory},
+        'runs': runs,
+    }
+    Path(args.out).write_text(json.dumps(report, indent=2), encoding='utf-8')
+    print(f"report written to {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
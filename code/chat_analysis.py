@@ -0,0 +1,107 @@
+from collections import Counter
+
+import diagnostics
+import helper
+from analytics_index import OVERALL
+
+
+class ChatAnalysis:
+    """every metric the dashboard and the pdf show for one selected user.
+
+    the streamlit app keeps one per (chat, user) across reruns, the cli builds one
+    per chat. each metric is computed on first use and then handed back as is, so
+    the report reuses what the tabs already drew. results are shared, so callers
+    must not modify them in place. hits / misses count the lookups per metric.
+    """
+
+    def __init__(self, index, selected_user=OVERALL):
+        self.index = index
+        self.selected_user = selected_user
+        self._results = {}
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def _get(self, name, compute):
+        if name in self._results:
+            self.hits[name] += 1
+        else:
+            self.misses[name] += 1
+            with diagnostics.stage(name, rows=self.index.message_count(self.selected_user)):
+                self._results[name] = compute()
+        return self._results[name]
+
+    def cache_stats(self):
+        """{metric: {'hits': n, 'misses': n}} for every metric looked up so far"""
+        return {name: {'hits': self.hits[name], 'misses': self.misses[name]}
+                for name in self.misses}
+
+    @property
+    def df(self):
+        return self.index.df
+
+    def rows(self):
+        return self._get('rows', lambda: self.index.rows(self.selected_user))
+
+    def fetch_stats(self):
+        return self._get('fetch_stats', lambda: self.index.fetch_stats(self.selected_user))
+
+    def monthly_timeline(self):
+        return self._get('monthly_timeline', lambda: self.index.monthly_timeline(self.selected_user))
+
+    def daily_timeline(self):
+        return self._get('daily_timeline', lambda: self.index.daily_timeline(self.selected_user))
+
+    def lod_timeline(self, width_px):
+        return self._get(f'lod_timeline {width_px}px', lambda: self.index.lod_timeline(self.selected_user, width_px))
+
+    def week_activity_map(self):
+        return self._get('week_activity_map', lambda: self.index.week_activity_map(self.selected_user))
+
+    def month_activity_map(self):
+        return self._get('month_activity_map', lambda: self.index.month_activity_map(self.selected_user))
+
+    def activity_heatmap(self):
+        return self._get('activity_heatmap', lambda: self.index.activity_heatmap(self.selected_user))
+
+    def time_activity_user_grid(self, top_k=None):
+        return self._get(f'time_activity_user_grid top{top_k}',
+                         lambda: self.index.time_activity_user_grid(self.selected_user, top_k))
+
+    def most_busy_users(self):
+        # the whole chat, whoever is selected
+        return self._get('most_busy_users', lambda: helper.most_busy_users(self.df))
+
+    def create_wordcloud(self, size=helper.WORDCLOUD_FULL):
+        return self._get(f'create_wordcloud {size[0]}x{size[1]}',
+                         lambda: self.index.create_wordcloud(self.selected_user, size))
+
+    def most_common_words(self):
+        return self._get('most_common_words', lambda: self.index.most_common_words(self.selected_user))
+
+    def emoji_helper(self):
+        return self._get('emoji_helper', lambda: self.index.emoji_helper(self.selected_user))
+
+    def reply_latency(self):
+        return self._get('reply_latency', lambda: helper.reply_latency(self.selected_user, self.index.conversation()))
+
+    def median_reply_minutes(self):
+        return self._get('median_reply_minutes',
+                         lambda: helper.median_reply_minutes(self.selected_user, self.index.conversation()))
+
+    def reply_edges(self):
+        return self._get('reply_edges', lambda: helper.reply_edges(self.selected_user, self.index.conversation()))
+
+    def conversation_sessions(self):
+        return self._get('conversation_sessions',
+                         lambda: helper.conversation_sessions(self.selected_user, self.index.conversation()))
+
+    def day_initiators(self):
+        return self._get('day_initiators', lambda: helper.day_initiators(self.selected_user, self.index.conversation()))
+
+
+def analysis_of(index, selected_user=OVERALL):
+    """the ChatAnalysis of selected_user kept on the index, so every session showing
+    the chat shares it and it goes away together with the index"""
+    if selected_user not in index.analyses:
+        index.analyses.setdefault(selected_user, ChatAnalysis(index, selected_user))
+    return index.analyses[selected_user]
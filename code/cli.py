@@ -0,0 +1,136 @@
+"""batch analysis of exported chats, without streamlit.
+
+    python code/cli.py exports/ --out summaries/ --workers 8 --pdf
+
+every .txt export in the input directory gets a <name>.json (or <name>.parquet)
+summary in the output directory, plus <name>.pdf with --pdf.
+
+with --incremental, parses and counters go to the parse cache, and a later export
+of the same chat only parses and counts the messages added since.
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+import diagnostics
+import preprocessor
+from analytics_index import AnalyticsIndex, OVERALL, open_chat, save_chat
+from chat_analysis import ChatAnalysis
+
+
+def _counts(series):
+    # json friendly {label: count}
+    return {str(k): int(v) for k, v in series.items()}
+
+
+def summarize(index, chat_name):
+    """dict with the overview numbers, timelines and top words/emojis of a chat"""
+    df = index.df
+    per_user = {}
+    for user in index.users():
+        messages, words, media, links = index.fetch_stats(user)
+        per_user[user] = {'messages': messages, 'words': words, 'media': media, 'links': links}
+
+    timeline = index.monthly_timeline(OVERALL)
+    words = index.most_common_words(OVERALL)
+    emojis = index.emoji_helper(OVERALL).head(20)
+    return {
+        'chat': chat_name,
+        'schema_version': preprocessor.SCHEMA_VERSION,
+        'messages': len(df),
+        'first_message': None if df.empty else str(df['date'].min()),
+        'last_message': None if df.empty else str(df['date'].max()),
+        'users': per_user,
+        'monthly_timeline': dict(zip(timeline['time'], map(int, timeline['message']))),
+        'weekday_activity': _counts(index.week_activity_map(OVERALL)),
+        'month_activity': _counts(index.month_activity_map(OVERALL)),
+        'top_words': [[str(w), int(c)] for w, c in zip(words[0], words[1])],
+        'top_emojis': [[str(e), int(c)] for e, c in zip(emojis[0], emojis[1])],
+    }
+
+
+def analyze_chat(path, out_dir, fmt='json', pdf=False, link_mode='urlextract', incremental=False):
+    """parse and summarize one export; returns the written paths"""
+    path = Path(path)
+    out_dir = Path(out_dir)
+    if incremental:
+        index = open_chat(path, link_mode=link_mode)
+    else:
+        index = AnalyticsIndex(preprocessor.preprocess_file(path), link_mode=link_mode)
+    summary = summarize(index, path.name)
+    if incremental:
+        save_chat(index)
+    written = []
+
+    if fmt == 'parquet':
+        target = out_dir / f"{path.stem}.parquet"
+        table = pd.DataFrame.from_dict(summary['users'], orient='index')
+        table.index.name = 'user'
+        table.to_parquet(target)
+    else:
+        target = out_dir / f"{path.stem}.json"
+        target.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding='utf-8')
+    written.append(target)
+
+    if pdf:
+        # imported here so json-only runs never load matplotlib / reportlab
+        import report
+        target = out_dir / f"{path.stem}.pdf"
+        # chats already run one per process, so charts render in this one
+        target.write_bytes(report.build_report(ChatAnalysis(index), path.name, workers=1))
+        written.append(target)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a directory of exported WhatsApp chats.")
+    parser.add_argument('input', help="directory with exported chat .txt files")
+    parser.add_argument('--out', default='summaries', help="output directory (default: summaries)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="chats analyzed in parallel")
+    parser.add_argument('--format', choices=['json', 'parquet'], default='json',
+                        help="json: full summary, parquet: per-user stats table")
+    parser.add_argument('--pdf', action='store_true', help="also write the PDF report of each chat")
+    parser.add_argument('--link-mode', choices=['urlextract', 'regex'], default='urlextract',
+                        help="link detection used for the link counts")
+    parser.add_argument('--incremental', action='store_true',
+                        help="cache parses and counters, and only process what a re-export added")
+    parser.add_argument('--log-level', default=os.environ.get('CHATLYTICS_LOG_LEVEL', 'WARNING'),
+                        help="DEBUG also logs the timing of every parse stage (default: WARNING)")
+    args = parser.parse_args(argv)
+    diagnostics.configure_logging(args.log_level)
+
+    chats = sorted(Path(args.input).glob('*.txt'))
+    if not chats:
+        print(f"No .txt exports found in {args.input}", file=sys.stderr)
+        return 1
+    Path(args.out).mkdir(parents=True, exist_ok=True)
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=diagnostics.configure_logging,
+                             initargs=(args.log_level,)) as pool:
+        futures = {
+            pool.submit(analyze_chat, chat, args.out, args.format, args.pdf, args.link_mode,
+                        args.incremental): chat
+            for chat in chats
+        }
+        for future in as_completed(futures):
+            chat = futures[future]
+            try:
+                written = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"FAILED {chat.name}: {e}", file=sys.stderr)
+            else:
+                print(f"ok {chat.name} -> {', '.join(p.name for p in written)}")
+
+    print(f"{len(chats) - failed}/{len(chats)} chats analyzed")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
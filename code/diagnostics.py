@@ -0,0 +1,114 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# timing of the parse / aggregate stages, for the logs, stats() and the app's
+# diagnostics panel. nothing here ever sees message text or user names.
+#
+# peak memory needs tracemalloc, which slows every allocation down, so it is only
+# measured with CHATLYTICS_TRACE_MEMORY=1 (or trace_memory(True)).
+
+logger = logging.getLogger(__name__)
+
+_stats = {}
+_lock = threading.Lock()
+_local = threading.local()
+_preload = set()
+
+
+def configure_logging(level=None):
+    """log to stderr at level (default: CHATLYTICS_LOG_LEVEL, else WARNING)"""
+    level = level or os.environ.get('CHATLYTICS_LOG_LEVEL', 'WARNING')
+    logging.basicConfig(level=level.upper(), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+
+def pool_context(*preload):
+    """multiprocessing context for worker pools: a forkserver (spawn where there is
+    none), never a plain fork. the app runs its pools inside the threaded streamlit
+    server, and a forked child can inherit a lock another thread held and hang on it.
+
+    the forkserver imports the preload modules once and forks the workers from there,
+    so they do not each import pandas again. name installed packages: the server does
+    not get the app's sys.path, so our own flat modules cannot be preloaded. every
+    caller's modules are kept, the list is read when the first pool starts the server.
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    _preload.update(preload)
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(sorted(_preload))
+    return context
+
+
+def trace_memory(enabled=True):
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+class Stage:
+    """one running stage; set .rows inside the with block if not known up front"""
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self.peak = 0
+
+
+@contextmanager
+def stage(name, rows=None):
+    """time the block as stage `name` (duration, rows, peak memory above the start)"""
+    current = Stage(name, rows)
+    stack = _local.__dict__.setdefault('stack', [])
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        used, peak = tracemalloc.get_traced_memory()
+        # the enclosing stage keeps its own peak before this one resets the counter
+        if stack:
+            stack[-1].peak = max(stack[-1].peak, peak)
+        tracemalloc.reset_peak()
+        start_used = used
+    stack.append(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        peak_mb = None
+        if tracing and tracemalloc.is_tracing():
+            current.peak = max(current.peak, tracemalloc.get_traced_memory()[1])
+            peak_mb = round((current.peak - start_used) / 2**20, 2)
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, current.peak)
+        _record(name, seconds, current.rows, peak_mb)
+
+
+def _record(name, seconds, rows, peak_mb):
+    with _lock:
+        entry = _stats.setdefault(name, {'calls': 0, 'total_seconds': 0.0})
+        entry['calls'] += 1
+        entry['total_seconds'] += seconds
+        entry.update(seconds=seconds, rows=rows, peak_mb=peak_mb)
+    logger.debug("stage %s: %.3fs, rows=%s, peak_mb=%s", name, seconds, rows, peak_mb)
+
+
+def stats():
+    """{stage: {calls, total_seconds, seconds, rows, peak_mb}} for this process; the
+    last three are from the latest run of the stage"""
+    with _lock:
+        return {name: dict(entry) for name, entry in _stats.items()}
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+if os.environ.get('CHATLYTICS_TRACE_MEMORY') == '1':
+    trace_memory(True)
@@ -0,0 +1,287 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import logging
+
+import pandas as pd
+
+import preprocessor
+from diagnostics import stage
+
+logger = logging.getLogger(__name__)
+
+# on-disk cache of parsed chats. streamlit re-runs app.py top to bottom on every
+# widget change, so without this we would re-parse the whole upload each time.
+# an entry is <sha256 of the upload>-v<schema version>.parquet, plus files with the
+# same stem: .json (size and head hash of the chat, the entry it was appended to)
+# and .<name>.parquet (counters an AnalyticsIndex computed over the rows)
+
+CACHE_DIR = Path(os.environ.get('CHATLYTICS_CACHE_DIR', Path.home() / '.cache' / 'chatlytics'))
+MAX_CACHE_BYTES = int(os.environ.get('CHATLYTICS_CACHE_MAX_MB', '512')) * 1024 * 1024
+
+# bytes hashed to shortlist earlier exports of a chat before hashing the full prefix
+HEAD_SIZE = 64 * 1024
+
+# temp files older than this are leftovers of a crashed write, no write takes so long
+STALE_TMP_SECONDS = 60 * 60
+
+
+def parquet_available():
+    """parquet needs pyarrow; without it the cache just stays off"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def file_hash(path, size=None, block_size=1024 * 1024):
+    """sha256 of a file (of its first `size` bytes when given), read in blocks; the
+    full hash is the cache key"""
+    digest = hashlib.sha256()
+    remaining = os.path.getsize(path) if size is None else size
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+
+def spool(fileobj, block_size=1024 * 1024):
+    """copy an upload to a temp file, hashing it on the way; returns (path, key).
+    the caller removes the file"""
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile('wb', suffix='.txt', delete=False) as tmp:
+        for block in iter(lambda: fileobj.read(block_size), b''):
+            digest.update(block)
+            tmp.write(block)
+    return tmp.name, digest.hexdigest()
+
+
+def cache_key(key, compact=False):
+    """entry name for a content hash; compact and default layouts are cached apart"""
+    return key + '-compact' if compact else key
+
+
+def _stem(key):
+    return f"{key}-v{preprocessor.SCHEMA_VERSION}"
+
+
+def cache_path(key):
+    return CACHE_DIR / f"{_stem(key)}.parquet"
+
+
+def manifest_path(key):
+    return CACHE_DIR / f"{_stem(key)}.json"
+
+
+def state_path(key, name):
+    return CACHE_DIR / f"{_stem(key)}.{name}.parquet"
+
+
+def load(key):
+    """cached dataframe for key, or None on miss / unreadable file"""
+    path = cache_path(key)
+    if not parquet_available() or not path.exists():
+        return None
+    try:
+        df = pd.read_parquet(path)
+    except Exception as e:
+        logger.warning("dropping unreadable cache file %s: %s", path.name, e)
+        path.unlink(missing_ok=True)
+        return None
+    # bump mtime so eviction sees this entry as recently used
+    os.utime(path)
+    return df
+
+
+def _write(path, write):
+    # write to a temp file first so a crash never leaves a half written file. its name
+    # is unique, an entry's .parquet and .json share a stem and may be written at once
+    tmp = None
+    try:
+        with tempfile.NamedTemporaryFile(dir=CACHE_DIR, prefix=path.name + '.', suffix='.tmp',
+                                         delete=False) as f:
+            tmp = Path(f.name)
+        write(tmp)
+        os.replace(tmp, path)
+    except Exception as e:
+        logger.warning("could not write cache file %s: %s", path.name, e)
+        if tmp is not None:
+            tmp.unlink(missing_ok=True)
+        return False
+    return True
+
+
+def load_manifest(key):
+    try:
+        return json.loads(manifest_path(key).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def store_manifest(key, manifest):
+    _write(manifest_path(key), lambda tmp: tmp.write_text(json.dumps(manifest)))
+
+
+def store(key, df, manifest=None):
+    """write df (and what is known about the chat it came from) for key, and trim
+    the cache back under MAX_CACHE_BYTES"""
+    if not parquet_available():
+        return
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    if not _write(cache_path(key), lambda tmp: df.to_parquet(tmp, index=False)):
+        return
+    if manifest is not None:
+        store_manifest(key, manifest)
+    evict()
+
+
+def store_state(key, state, rows):
+    """write counters computed over the `rows` rows cached for key ({name: series},
+    see AnalyticsIndex.state), so reopening or extending the chat can skip them.
+    counters stored before and not passed here are kept"""
+    if not parquet_available() or not cache_path(key).exists():
+        return
+    for name, values in state.items():
+        _write(state_path(key, name), lambda tmp: values.to_frame(name).to_parquet(tmp))
+    store_manifest(key, {**load_manifest(key), 'state_rows': rows})
+    evict()
+
+
+def load_state(key):
+    """(rows, {name: series}) stored for key. an entry without counters falls back to
+    the entry it was appended to: counters of an earlier export still hold for the
+    first rows of the longer chat. (0, {}) when nothing is stored"""
+    seen = set()
+    while key is not None and key not in seen and parquet_available():
+        seen.add(key)
+        manifest = load_manifest(key)
+        prefix = f"{_stem(key)}."
+        state = {}
+        for path in CACHE_DIR.glob(glob.escape(prefix) + '*.parquet'):
+            name = path.name[len(prefix):-len('.parquet')]
+            try:
+                state[name] = pd.read_parquet(path).iloc[:, 0]
+            except Exception as e:
+                logger.warning("ignoring unreadable cache file %s: %s", path.name, e)
+        if state and 'state_rows' in manifest:
+            return manifest['state_rows'], state
+        key = manifest.get('base')
+    return 0, {}
+
+
+def _chat_manifest(path, base=None, date_fields=None):
+    size = os.path.getsize(path)
+    return {'size': size, 'head': file_hash(path, min(size, HEAD_SIZE)), 'base': base,
+            'date_fields': date_fields}
+
+
+def find_base(path, compact=False):
+    """(key, size) of the cached export this chat file continues: an earlier export
+    of the same chat whose bytes are exactly the start of this file. None if there
+    is no such entry"""
+    if not parquet_available() or not CACHE_DIR.exists():
+        return None
+    size = os.path.getsize(path)
+    suffix = f"-v{preprocessor.SCHEMA_VERSION}.json"
+    heads = {}
+    candidates = []
+    for mpath in CACHE_DIR.glob('*' + suffix):
+        key = mpath.name[:-len(suffix)]
+        manifest = load_manifest(key)
+        base_size = manifest.get('size')
+        if key.endswith('-compact') != compact or not base_size or base_size >= size:
+            continue
+        n = min(base_size, HEAD_SIZE)
+        if n not in heads:
+            heads[n] = file_hash(path, n)
+        if heads[n] == manifest.get('head') and cache_path(key).exists():
+            candidates.append((base_size, key))
+
+    # the longest earlier export leaves the least to parse
+    for base_size, key in sorted(candidates, reverse=True):
+        if file_hash(path, base_size) == key.removesuffix('-compact'):
+            return key, base_size
+    return None
+
+
+def evict(max_bytes=None):
+    """drop temp files of crashed writes and entries from older schema versions, then
+    least recently used ones over the size limit"""
+    if max_bytes is None:
+        max_bytes = MAX_CACHE_BYTES
+    if not CACHE_DIR.exists():
+        return
+
+    current = f"-v{preprocessor.SCHEMA_VERSION}"
+    entries = {}
+    stale = time.time() - STALE_TMP_SECONDS
+    for path in CACHE_DIR.iterdir():
+        if path.suffix == '.tmp':
+            try:
+                if path.stat().st_mtime < stale:
+                    path.unlink(missing_ok=True)
+            except OSError:
+                pass
+            continue
+        if path.suffix not in ('.parquet', '.json'):
+            continue
+        stem = path.name.split('.', 1)[0]
+        if not stem.endswith(current):
+            path.unlink(missing_ok=True)
+            continue
+        st = path.stat()
+        mtime, size, paths = entries.get(stem, (0, 0, []))
+        entries[stem] = (max(mtime, st.st_mtime), size + st.st_size, paths + [path])
+
+    # an entry goes with all its files; its age is that of its newest file
+    entries = sorted(entries.values(), key=lambda entry: entry[0])
+    total = sum(size for _, size, _ in entries)
+    for _, size, paths in entries:
+        if total <= max_bytes:
+            break
+        for path in paths:
+            path.unlink(missing_ok=True)
+        total -= size
+
+
+def cached_preprocess_file(path, key=None, compact=False, workers=None):
+    """preprocess a chat file through the memory-mapped path, reusing a cached parse
+    of identical bytes.
+
+    a re-export of a chat cached before (same bytes, more messages at the end) is
+    not parsed again in full: the cached rows are kept and only the new tail is
+    parsed and appended, with the date order resolved for the whole earlier export
+    (kept in the manifest) rather than from the new messages alone.
+    """
+    key = cache_key(key or file_hash(path), compact)
+    with stage('cache load'):
+        df = load(key)
+    if df is not None:
+        return df
+
+    base = find_base(path, compact)
+    base_df = load(base[0]) if base else None
+    if base_df is not None:
+        base_key, base_size = base
+        # entries from before the manifest kept the date fields resolve from the tail
+        tail = preprocessor.preprocess_file(path, compact=compact, workers=workers, start=base_size,
+                                            date_fields=load_manifest(base_key).get('date_fields'))
+        logger.info("appending %d new messages to cached chat %s", len(tail), base_key[:12])
+        df = preprocessor.append_frame(base_df, tail, compact)
+        date_fields = tail.attrs.get('date_fields')
+    else:
+        base_key = None
+        df = preprocessor.preprocess_file(path, compact=compact, workers=workers)
+        date_fields = df.attrs.get('date_fields')
+    store(key, df, _chat_manifest(path, base_key, date_fields))
+    return df
@@ -1,186 +1,505 @@
+import mmap
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import logging
+import numpy as np
 import pandas as pd
 
+from diagnostics import pool_context, stage
+
+logger = logging.getLogger(__name__)
+
 # parse whatsapp chat text into a dataframe we use in app
 
-def preprocess(data):
-    print(f"DEBUG: Raw data length: {len(data)}")
-    print(f"DEBUG: First 500 chars of data: {data[:500]}")
-    
-    patterns = [
-        r'\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}\s-\s',
-        r'\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}\s',     
-        r'\d{1,2}-\d{1,2}-\d{2,4},\s\d{1,2}:\d{2}\s-\s',  
-        r'\d{1,2}\.\d{1,2}\.\d{2,4},\s\d{1,2}:\d{2}\s-\s', 
-        r'\[\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}:\d{2}\]', 
-    ]
-    
-    pattern = None
-    messages = []
-    dates = []
-    
-    for p in patterns:
-        print(f"DEBUG: Trying pattern: {p}")
-        test_messages = re.split(p, data)[1:]
-        test_dates = re.findall(p, data)
-        print(f"DEBUG: Found {len(test_messages)} messages and {len(test_dates)} dates with pattern {p}")
-        
-        if len(test_messages) > 0 and len(test_dates) > 0:
-            pattern = p
-            messages = test_messages
-            dates = test_dates
-            print(f"DEBUG: Using pattern: {pattern}")
-            break
-    
-    if not pattern or len(messages) == 0:
-        print("DEBUG: No valid pattern found, trying alternative parsing...")
-        lines = data.split('\n')
-        messages = []
-        dates = []
-        current_message = ""
-        
+# am / pm marker of 12h exports: "pm", "PM", "p.m.", after a space or a narrow nbsp,
+# and not the start of a word ("10:15 Amit: ...")
+_AMPM = r'(?:\s?[APap]\.?\s?[Mm]\.?(?![^\W\d_]))?'
+
+# timestamp prefixes of the export formats we know, tried in this order. 0 is the
+# 24h android export and 1 the 12h one ("1/2/24, 9:05 pm - "); the others take
+# either clock. the captured text is turned into dates by parse_dates()
+patterns = [
+    r'\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}\s-\s',
+    r'\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}' + _AMPM + r'\s(?:-\s)?',
+    r'\d{1,2}-\d{1,2}-\d{2,4},\s\d{1,2}:\d{2}' + _AMPM + r'\s-\s',
+    r'\d{1,2}\.\d{1,2}\.\d{2,4},\s\d{1,2}:\d{2}' + _AMPM + r'\s-\s',
+    r'\[\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}:\d{2}' + _AMPM + r'\]',
+]
+
+# bump whenever the columns or dtypes preprocess() returns change, so cached
+# parses written by an older version are not reused
+SCHEMA_VERSION = 3
+
+# how much of the chat we look at to decide the format
+SAMPLE_SIZE = 64 * 1024
+
+# a message header must start the line; exports sometimes put a BOM / LRM mark in front
+_line_patterns = [re.compile(r'[\ufeff\u200e]?(' + p + ')') for p in patterns]
+_fallback_date = re.compile(r'\[?\d{1,2}[/\-\.]\d{1,2}[/\-\.]\d{2,4}(?:,?\s\d{1,2}:\d{2}(?::\d{2})?' + _AMPM + ')?')
+
+
+def detect_pattern(sample):
+    """index of the first pattern that starts a line in the sample, None if nothing fits"""
+    lines = sample.splitlines()
+    for i, line_pattern in enumerate(_line_patterns):
         for line in lines:
-            if re.match(r'\d{1,2}[/\-\.]\d{1,2}[/\-\.]\d{2,4}', line):
-                if current_message:
-                    messages.append(current_message.strip())
-                current_message = line
-            else:
-                current_message += "\n" + line
-        
-        if current_message:
-            messages.append(current_message.strip())
-        
-        for msg in messages:
-            date_match = re.search(r'\d{1,2}[/\-\.]\d{1,2}[/\-\.]\d{2,4}', msg)
-            if date_match:
-                dates.append(date_match.group())
+            if line_pattern.match(line):
+                return i
+    return None
+
+
+def iter_messages(lines, pattern_index):
+    """yield (date_text, user_message) per message from an iterable of lines.
+
+    one pass, one precompiled regex: a line starting with a timestamp opens a new
+    message, any other line is a continuation of the current one. lines before the
+    first timestamp are dropped (same as the old re.split()[1:]).
+    """
+    if pattern_index is None:
+        # unknown format: every line starting with a date opens a message, and the
+        # whole line stays in the body so the user extraction can still find the name
+        line_pattern = _fallback_date
+    else:
+        line_pattern = _line_patterns[pattern_index]
+
+    date_text = None
+    body = []
+    for line in lines:
+        line = line.rstrip('\r\n')
+        m = line_pattern.match(line)
+        if m:
+            if date_text is not None:
+                yield date_text, '\n'.join(body)
+            if pattern_index is None:
+                date_text = m.group()
+                body = [line]
             else:
-                dates.append("")
-    
-    print(f"DEBUG: Final - Found {len(messages)} messages and {len(dates)} dates")
-
-    if len(messages) != len(dates):
-        print(f"DEBUG: Mismatch in messages ({len(messages)}) and dates ({len(dates)}) count")
-        min_len = min(len(messages), len(dates))
-        messages = messages[:min_len]
-        dates = dates[:min_len]
-
-    df = pd.DataFrame({'user_message': messages, 'message_date': dates})
-    print(f"DEBUG: DataFrame shape after initial creation: {df.shape}")
-    print(f"DEBUG: First few user_messages: {df['user_message'].head().tolist()}")
-    
-    try:
-        if pattern == patterns[0]:  
-            df['message_date'] = pd.to_datetime(df['message_date'], format='%d/%m/%Y, %H:%M - ')
-        elif pattern == patterns[1]:  
-            df['message_date'] = pd.to_datetime(df['message_date'], format='%d/%m/%Y, %H:%M ')
-        elif pattern == patterns[2]:  
-            df['message_date'] = pd.to_datetime(df['message_date'], format='%d-%m-%Y, %H:%M - ')
-        elif pattern == patterns[3]:  
-            df['message_date'] = pd.to_datetime(df['message_date'], format='%d.%m.%Y, %H:%M - ')
-        elif pattern == patterns[4]:  
-            df['message_date'] = pd.to_datetime(df['message_date'], format='[%d/%m/%Y, %H:%M:%S]')
-        else:
-            df['message_date'] = pd.to_datetime(df['message_date'], errors='coerce')
-    except Exception as e:
-        print(f"DEBUG: Date parsing error: {e}")
-        df['message_date'] = pd.to_datetime(df['message_date'], errors='coerce')
+                date_text = m.group(1)
+                body = [line[m.end():]]
+        elif date_text is not None:
+            body.append(line)
+    if date_text is not None:
+        yield date_text, '\n'.join(body)
 
-    df.rename(columns={'message_date': 'date'}, inplace=True)
 
-    users = []
+# "user: message" split, the old per-row cascade folded into one regex. alternatives
+# are tried left to right at position 0, so the first one that matches wins exactly
+# like the old if/elif chain did:
+#   1. "user: message"
+#   2. "[time] user: message"
+#   3. "... - user: message"
+#   4. bare "user:message" when the name is short and only word chars/space/-/.
+_user_message = re.compile(
+    r'^(?:(?P<u1>[^:]+):\s(?P<m1>.+)$'
+    r'|\[.*?\]\s*(?P<u2>[^:]+):\s(?P<m2>.+)$'
+    r'|.*?-\s*(?P<u3>[^:]+):\s(?P<m3>.+)$'
+    r'|(?P<u4>[\w\s\-\.]+):(?P<m4>.*))',
+    re.DOTALL,
+)
+
+
+def split_user_messages(user_message):
+    """vectorized split of the raw message bodies into (user, message) series.
+
+    rows that match none of the shapes become 'group_notification' with the whole
+    text as message.
+    """
+    cleaned = user_message.str.strip()
+    parts = cleaned.str.extract(_user_message)
+
+    # the bare colon fallback only counts for names shorter than 50 chars
+    too_long = parts['u4'].str.strip().str.len() >= 50
+    parts.loc[too_long, ['u4', 'm4']] = None
+
+    users = parts['u1'].fillna(parts['u2']).fillna(parts['u3']).fillna(parts['u4'])
+    messages = parts['m1'].fillna(parts['m2']).fillna(parts['m3']).fillna(parts['m4'])
+
+    unmatched = users.isna()
+    users = users.str.strip().where(~unmatched, 'group_notification')
+    messages = messages.str.strip().where(~unmatched, cleaned.str.strip())
+    return users, messages
+
+
+# calendar orders for categorical columns
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+               'August', 'September', 'October', 'November', 'December']
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+# hour -> period label, same labels as always: "00-1", "1-2", ..., "22-23", "23-00"
+PERIODS = ['00-1'] + [f"{h}-{h + 1}" for h in range(1, 23)] + ['23-00']
+
+# smallest integer type that holds each calendar field
+_small_ints = {'year': 'int16', 'month_num': 'int8', 'day': 'int8', 'hour': 'int8', 'minute': 'int8'}
+
+
+# period lookup indexed by hour; position -1 (hour code of a NaT row) is 'Unknown'
+_period_lookup = np.array(PERIODS + ['Unknown'], dtype=object)
+
+
+def add_calendar_features(df):
+    """derived calendar columns from 'date', all computed from integer codes.
+
+    month / day_name are categoricals in calendar order built from the month and
+    weekday numbers, period is a lookup by hour. rows whose date could not be
+    parsed get missing values (period 'Unknown') instead of made up dates.
+    """
+    dates = df['date'].dt
+    missing = df['date'].isna().to_numpy()
+
+    month_codes = np.where(missing, -1, dates.month.fillna(0).to_numpy(dtype='int64') - 1)
+    day_codes = np.where(missing, -1, dates.dayofweek.fillna(0).to_numpy(dtype='int64'))
+    hour_codes = np.where(missing, -1, dates.hour.fillna(0).to_numpy(dtype='int64'))
+
+    df['only_date'] = dates.date
+    df['year'] = dates.year
+    df['month_num'] = dates.month
+    df['month'] = pd.Categorical.from_codes(month_codes, categories=MONTH_NAMES, ordered=True)
+    df['day'] = dates.day
+    df['day_name'] = pd.Categorical.from_codes(day_codes, categories=DAY_NAMES, ordered=True)
+    df['hour'] = dates.hour
+    df['minute'] = dates.minute
+    df['period'] = _period_lookup[hour_codes]
+    return df
+
+
+def compact_frame(df):
+    """shrink a parsed chat frame in place of the default dtypes.
+
+    - user / month / day_name / period become categoricals (calendar ones ordered)
+    - year and the other calendar fields become int16 / int8 (nullable Int* when
+      some dates failed to parse)
+    - only_date becomes a datetime64 day instead of python date objects
+
+    helper functions work the same on either layout.
+    """
+    df = df.copy()
+    df['user'] = df['user'].astype('category')
+    df['month'] = pd.Categorical(df['month'], categories=MONTH_NAMES, ordered=True)
+    df['day_name'] = pd.Categorical(df['day_name'], categories=DAY_NAMES, ordered=True)
+    periods = PERIODS + ['Unknown'] if (df['period'] == 'Unknown').any() else PERIODS
+    df['period'] = pd.Categorical(df['period'], categories=periods, ordered=True)
+    for col, dtype in _small_ints.items():
+        if df[col].isna().any():
+            dtype = dtype.capitalize()
+        df[col] = df[col].astype(dtype)
+    df['only_date'] = df['date'].dt.normalize()
+    return df
+
+
+def parse_lines(lines, pattern_index):
+    """messages from an iterable of chat lines that starts at a message boundary.
+
+    returns the raw timestamp text plus the user / message split; timestamps are
+    parsed later over the whole chat so the fallback rules see every row.
+    """
+    dates = []
     messages = []
-    for i, message in enumerate(df['user_message']):
-        if i < 3:  
-            print(f"DEBUG: Message {i}: '{message[:100]}...'")
-
-        message = re.sub(r'^(?i:(?:am|pm))\s*-\s*', '', message.strip())
-        
-        user_message = None
-        
-        match1 = re.match(r'^([^:]+):\s(.+)$', message, re.DOTALL)
-        if match1:
-            user_message = (match1.group(1).strip(), match1.group(2).strip())
-        
-        if not user_message:
-            match2 = re.match(r'^\[.*?\]\s*([^:]+):\s(.+)$', message, re.DOTALL)
-            if match2:
-                user_message = (match2.group(1).strip(), match2.group(2).strip())
-        
-        if not user_message:
-            match3 = re.match(r'^.*?-\s*([^:]+):\s(.+)$', message, re.DOTALL)
-            if match3:
-                user_message = (match3.group(1).strip(), match3.group(2).strip())
-        
-        if not user_message:
-            colon_pos = message.find(':')
-            if colon_pos > 0:
-                potential_user = message[:colon_pos].strip()
-                potential_message = message[colon_pos+1:].strip()
-                if len(potential_user) < 50 and not re.search(r'[^\w\s\-\.]', potential_user):
-                    user_message = (potential_user, potential_message)
-        
-        if user_message:
-            users.append(user_message[0])
-            messages.append(user_message[1])
-            if i < 3:
-                print(f"DEBUG: Extracted user: '{user_message[0]}', message: '{user_message[1][:50]}...'")
+    for date_text, user_message in iter_messages(lines, pattern_index):
+        dates.append(date_text)
+        messages.append(user_message)
+
+    df = pd.DataFrame({'message_date': dates, 'user_message': messages}, dtype=str)
+    with stage('user extraction', rows=len(df)):
+        df['user'], df['message'] = split_user_messages(df['user_message'])
+    return df.drop(columns=['user_message'])
+
+
+# one line of chat text, newline included (the last one may have none)
+_text_line = re.compile(r'[^\n]*\n|[^\n]+\Z')
+
+
+def iter_text_lines(text):
+    """lines of text one at a time. a split() copy, or the UCS-4 buffer io.StringIO
+    copies the text into, would be several times the size of the chat"""
+    return (m.group() for m in _text_line.finditer(text))
+
+
+def parse_chunk(text, pattern_index):
+    """parse_lines over a piece of chat text"""
+    return parse_lines(iter_text_lines(text), pattern_index)
+
+
+def iter_mapped_lines(mm, start, end):
+    """decoded lines of mm[start:end], one line at a time. start and end must be
+    line starts (or the end of the file)"""
+    mm.seek(start)
+    while mm.tell() < end:
+        yield mm.readline().decode('utf-8')
+
+
+def parse_file_chunk(path, start, end, pattern_index):
+    """parse_lines over bytes start..end of a chat file; each worker maps the file
+    itself so no chat text is pickled between processes"""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return parse_lines(iter_mapped_lines(mm, start, end), pattern_index)
+
+
+def chunk_bounds(data, pattern_index, parts):
+    """start offsets that cut data into about `parts` pieces, each starting on a line
+    that opens a message, so multi-line messages are never split.
+
+    data is the chat as str, or as bytes / mmap for the memory-mapped path.
+    """
+    line_pattern = _fallback_date if pattern_index is None else _line_patterns[pattern_index]
+    newline = '\n' if isinstance(data, str) else b'\n'
+
+    def opens_message(pos):
+        if isinstance(data, str):
+            return line_pattern.match(data, pos)
+        # a header is pure ascii after an optional BOM / LRM, 64 bytes is plenty
+        return line_pattern.match(data[pos:pos + 64].decode('utf-8', errors='ignore'))
+
+    bounds = [0]
+    for i in range(1, parts):
+        pos = data.find(newline, max(len(data) * i // parts, bounds[-1]))
+        while pos != -1 and not opens_message(pos + 1):
+            pos = data.find(newline, pos + 1)
+        if pos == -1:
+            break
+        if pos + 1 > bounds[-1]:
+            bounds.append(pos + 1)
+    return bounds
+
+
+# below this size starting worker processes costs more than it saves
+PARALLEL_MIN_SIZE = 8 * 1024 * 1024
+
+
+def parse_parallel(data, pattern_index, workers):
+    """parse_chunk over message-aligned pieces of data in a process pool, concatenated
+    in input order, so the result equals parse_chunk(data, pattern_index)"""
+    bounds = chunk_bounds(data, pattern_index, workers * 4) + [len(data)]
+    chunks = [data[start:end] for start, end in zip(bounds, bounds[1:])]
+    logger.debug("parsing %d chunks with %d workers", len(chunks), workers)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context('pandas')) as pool:
+        frames = list(pool.map(parse_chunk, chunks, repeat(pattern_index)))
+    return pd.concat(frames, ignore_index=True)
+
+
+def preprocess(data, compact=False, workers=None, date_fields=None):
+    """parse exported chat text into one row per message.
+
+    compact=True returns the smaller dtype layout from compact_frame().
+    workers > 1 splits big chats at message boundaries and parses the pieces in
+    that many processes; the result is the same as the serial parse.
+    date_fields: see parse_dates(); the ones used end up in df.attrs['date_fields'].
+    """
+    logger.debug("raw data length: %d", len(data))
+
+    with stage('pattern detect'):
+        pattern_index = detect_pattern(data[:SAMPLE_SIZE])
+    _log_pattern(pattern_index)
+
+    with stage('split') as split:
+        if workers and workers > 1 and len(data) >= PARALLEL_MIN_SIZE:
+            df = parse_parallel(data, pattern_index, workers)
         else:
-            if any(keyword in message.lower() for keyword in ['added', 'removed', 'left', 'joined', 'created', 'changed']):
-                users.append('group_notification')
-                messages.append(message.strip())
+            df = parse_chunk(data, pattern_index)
+        split.rows = len(df)
+
+    return build_frame(df, pattern_index, compact, date_fields)
+
+
+def preprocess_file(path, compact=False, workers=None, start=0, date_fields=None):
+    """preprocess() for a chat export on disk.
+
+    the file is memory-mapped and decoded one line at a time, so the raw bytes,
+    a decoded copy of the whole chat and the split lines are never held at once;
+    peak memory stays close to the size of the final dataframe.
+
+    start > 0 parses only the messages after that byte offset (the end of an earlier
+    export of the same chat); the format is still detected from the top of the file.
+    pass the date_fields of that earlier parse along, or a tail whose dates all fit
+    day first is read day first even in a month first chat.
+    """
+    if os.path.getsize(path) <= start:
+        return preprocess('', compact=compact, date_fields=date_fields)
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        logger.debug("raw data length: %d bytes, parsing from byte %d", len(mm), start)
+        with stage('pattern detect'):
+            # the sample may end inside a multi-byte character, ignore that tail
+            pattern_index = detect_pattern(mm[:SAMPLE_SIZE].decode('utf-8', errors='ignore'))
+        _log_pattern(pattern_index)
+
+        # lines are decoded as they are read, so decoding is part of the split here
+        with stage('split') as split:
+            if workers and workers > 1 and len(mm) - start >= PARALLEL_MIN_SIZE:
+                bounds = [start] + [b for b in chunk_bounds(mm, pattern_index, workers * 4) if b > start]
+                bounds.append(len(mm))
+                logger.debug("parsing %d chunks with %d workers", len(bounds) - 1, workers)
+                with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context('pandas')) as pool:
+                    frames = list(pool.map(parse_file_chunk, repeat(path), bounds[:-1], bounds[1:],
+                                           repeat(pattern_index)))
+                df = pd.concat(frames, ignore_index=True)
             else:
-                users.append('group_notification')
-                messages.append(message.strip())
-            if i < 3:
-                print(f"DEBUG: No pattern matched, treating as group notification")
-
-    df['user'] = users
-    df['message'] = messages
-    df.drop(columns=['user_message'], inplace=True)
-    
-    print(f"DEBUG: Final DataFrame shape: {df.shape}")
-    print(f"DEBUG: Unique users: {df['user'].unique()}")
-    print(f"DEBUG: Sample messages: {df['message'].head().tolist()}")
-    
+                df = parse_lines(iter_mapped_lines(mm, start, len(mm)), pattern_index)
+            split.rows = len(df)
+
+    return build_frame(df, pattern_index, compact, date_fields)
+
+
+# pieces of a captured timestamp, whichever export it came from: two date fields
+# (day and month, in an order resolve_date_format() works out), the year, and an
+# optional time with optional seconds and am / pm
+_timestamp_parts = re.compile(
+    r'\[?\s*(?P<a>\d{1,2})[/\-\.](?P<b>\d{1,2})[/\-\.](?P<y>\d{2,4})'
+    r'(?:,?\s*(?P<H>\d{1,2}):(?P<M>\d{2})(?::(?P<S>\d{2}))?(?:\s?(?P<p>[APap]\.?\s?[Mm]\.?))?)?'
+)
+
+# distinct timestamps the format is resolved from
+DATE_SAMPLE_SIZE = 2000
+
+
+def resolve_date_format(parts):
+    """strptime directive of each timestamp field, from the _timestamp_parts fields
+    of some timestamps: {'a': '%d', 'b': '%m', 'y': '%Y', 'H': '%H', 'M': '%M'}, say.
+    None when the timestamps disagree with each other.
+
+    day first unless a second field above 12 says month first; %y or %Y by the
+    year digits; %I and %p when there is an am / pm, %H otherwise. stamps that
+    are no date either way (both fields above 12, or one above 31) are ignored.
+    """
+    parts = parts.dropna(subset=['a', 'b', 'y'])
+    firsts, seconds = parts['a'].astype(int), parts['b'].astype(int)
+    plausible = ~((firsts > 12) & (seconds > 12)) & (firsts <= 31) & (seconds <= 31)
+    parts, firsts, seconds = parts[plausible], firsts[plausible], seconds[plausible]
+    if parts.empty:
+        return None
+    if (firsts > 12).any() and (seconds > 12).any():
+        return None
+    fields = {'a': '%m', 'b': '%d'} if (seconds > 12).any() else {'a': '%d', 'b': '%m'}
+    year_digits = parts['y'].str.len().unique()
+    if len(year_digits) != 1 or year_digits[0] not in (2, 4):
+        return None
+    fields['y'] = '%y' if year_digits[0] == 2 else '%Y'
+    present = {}
+    for field in ('H', 'S', 'p'):
+        # a time, seconds and an am / pm are all or nothing
+        present[field] = parts[field].notna().sum()
+        if 0 < present[field] < len(parts):
+            return None
+    if present['H']:
+        fields.update(H='%I' if present['p'] else '%H', M='%M')
+    if present['S']:
+        fields['S'] = '%S'
+    if present['p']:
+        fields['p'] = '%p'
+    return fields
+
+
+def layout_format(text, fields):
+    """strptime format that reads text itself, brackets, separators and all, with
+    the directives in fields; None when text does not have those fields, or spells
+    am / pm in a way %p does not read ("p.m.")"""
+    m = _timestamp_parts.match(text)
+    if m is None or {name for name, value in m.groupdict().items() if value} != fields.keys():
+        return None
+    if 'p' in fields and m.group('p').lower() not in ('am', 'pm'):
+        return None
+    out, end = [], 0
+    for name in sorted(fields, key=m.start):
+        out += [text[end:m.start(name)].replace('%', '%%'), fields[name]]
+        end = m.end(name)
+    out.append(text[end:].replace('%', '%%'))
+    return ''.join(out)
+
+
+def canonical_timestamps(parts):
+    """'a/b/y[ H:M[:S][ AM]]' text of the parts, one layout for every export; the
+    time pieces a stamp does not have are left out"""
+    text = parts['a'] + '/' + parts['b'] + '/' + parts['y']
+    text = text + (' ' + parts['H'] + ':' + parts['M']).fillna('')
+    text = text + (':' + parts['S']).fillna('')
+    return text + (' ' + parts['p'].str[0].str.upper() + 'M').fillna('')
+
+
+def parse_dates(texts, fields=None):
+    """(datetime series, date fields) of the captured timestamp texts.
+
+    exports repeat the same minute stamp many times, so every distinct text is
+    parsed once. the format (day / month order, year digits, 12h or 24h clock) is
+    resolved from an even sample of them, and they are converted with one exact
+    format in the layout of the first. stamps that layout does not read are pulled
+    apart and parsed from a canonical layout; if they show the sample was wrong
+    (a month above 12, say), all stamps are. texts that fit nothing become NaT.
+
+    fields resolved for an earlier part of the same chat are used as they are,
+    since a few new messages can not tell the day / month order apart.
+    """
+    codes, uniques = pd.factorize(texts)
+    uniques = pd.Series(uniques, dtype=str)
+    dates = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[us]')
+    known = fields is not None
+    parts = uniques.iloc[::max(len(uniques) // DATE_SAMPLE_SIZE, 1)].str.extract(_timestamp_parts)
+    if not known:
+        fields = resolve_date_format(parts)
+    if fields is not None and len(uniques):
+        raw_format = layout_format(uniques.iloc[0], fields)
+        if raw_format is not None:
+            logger.debug("date format %r for %d distinct timestamps", raw_format, len(uniques))
+            dates = pd.to_datetime(uniques, format=raw_format, errors='coerce')
+
+    failed = dates.isna().to_numpy()
+    if failed.any():
+        rest = uniques[failed].str.extract(_timestamp_parts)
+        wider = fields if known else resolve_date_format(pd.concat([parts, rest]))
+        if wider != fields:
+            fields, failed = wider, np.ones(len(uniques), dtype=bool)
+            rest = uniques.str.extract(_timestamp_parts)
+        if fields is not None:
+            canonical = canonical_timestamps(rest)
+            date_format = layout_format(canonical.dropna().iloc[0], fields) if canonical.notna().any() else None
+            if date_format is not None:
+                dates[failed] = pd.to_datetime(canonical, format=date_format, errors='coerce').to_numpy()
+        else:
+            # one element at a time, from the canonical text: the loose parser can
+            # not read the brackets or the " - " around the captured stamps
+            logger.warning("timestamps mix layouts, parsing %d distinct ones loosely", int(failed.sum()))
+            dates[failed] = pd.to_datetime(canonical_timestamps(rest), format='mixed', dayfirst=True,
+                                           errors='coerce').to_numpy()
+
+    values = dates.to_numpy()
+    # code -1 (no timestamp) picks the NaT on the end
+    values = np.append(values, values.dtype.type('NaT'))[codes]
+    return pd.Series(values, index=texts.index, name=texts.name), fields
+
+
+def _log_pattern(pattern_index):
+    if pattern_index is None:
+        logger.info("no known timestamp format found, falling back to loose date parsing")
+    else:
+        logger.debug("using pattern %d", pattern_index)
+
+
+def append_frame(df, tail, compact=False):
+    """rows of a chat followed by the rows parsed from its new tail"""
+    df = pd.concat([df, tail], ignore_index=True)
+    # categoricals with different categories come out of concat as plain values
+    return compact_frame(df) if compact else df
+
+
+def build_frame(df, pattern_index, compact=False, date_fields=None):
+    """parsed timestamps, empty message removal and derived columns on top of the
+    raw parse_lines() output. the date fields the timestamps were read with are
+    kept in df.attrs['date_fields']"""
+    # counts only: chat text and names never go to the logs
+    logger.debug("found %d messages", len(df))
+
+    with stage('date parse', rows=len(df)):
+        df['message_date'], date_fields = parse_dates(df['message_date'], date_fields)
+
+    df.rename(columns={'message_date': 'date'}, inplace=True)
+
     df = df[df['message'].str.strip() != '']
-    print(f"DEBUG: After removing empty messages: {df.shape}")
-
-    try:
-        df['only_date'] = df['date'].dt.date
-        df['year'] = df['date'].dt.year
-        df['month_num'] = df['date'].dt.month
-        df['month'] = df['date'].dt.month_name()
-        df['day'] = df['date'].dt.day
-        df['day_name'] = df['date'].dt.day_name()
-        df['hour'] = df['date'].dt.hour
-        df['minute'] = df['date'].dt.minute
-
-        period = []
-        for hour in df['hour']:
-            if pd.isna(hour):
-                period.append("Unknown")
-            elif hour == 23:
-                period.append(str(int(hour)) + "-" + str('00'))
-            elif hour == 0:
-                period.append(str('00') + "-" + str(int(hour + 1)))
-            else:
-                period.append(str(int(hour)) + "-" + str(int(hour + 1)))
-
-        df['period'] = period
-    except Exception as e:
-        print(f"DEBUG: Date processing error: {e}")
-        df['only_date'] = pd.Timestamp.now().date()
-        df['year'] = 2024
-        df['month_num'] = 1
-        df['month'] = 'January'
-        df['day'] = 1
-        df['day_name'] = 'Monday'
-        df['hour'] = 12
-        df['minute'] = 0
-        df['period'] = '12-13'
-
-    print(f"DEBUG: Final processed DataFrame shape: {df.shape}")
-    print(f"DEBUG: Date range: {df['date'].min()} to {df['date'].max()}")
-    
+    logger.debug("%d messages left after dropping empty ones", len(df))
+
+    with stage('derived columns', rows=len(df)):
+        df = add_calendar_features(df)
+
+    if compact:
+        with stage('compact', rows=len(df)):
+            df = compact_frame(df)
+    df.attrs['date_fields'] = date_fields
     return df
\ No newline at end of file
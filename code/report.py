@@ -0,0 +1,299 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from threading import Lock
+
+import matplotlib
+matplotlib.use('Agg')  # render off screen, no display needed
+from matplotlib.figure import Figure
+import matplotlib.dates as mdates
+from matplotlib.ticker import MaxNLocator
+import seaborn as sns
+import pandas as pd
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, PageBreak, Table, TableStyle
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib import colors
+
+import timelines
+from diagnostics import pool_context
+
+# pdf report builder, shared by the streamlit app and the batch cli (no streamlit here).
+# charts are drawn from small aggregates, optionally in a process pool, and the
+# png of each (chat, user, chart) is kept so rebuilding a report is mostly layout.
+
+# rendered pngs by (chat key, selected user, chart kind), least recently used dropped first
+MAX_CACHED_CHARTS = 256
+_png_cache = OrderedDict()
+# the app builds pdfs on download threads, one report may evict what another reads
+_png_lock = Lock()
+
+DPI = 180
+# the daily chart is 6 inches wide, its timeline gets one point per couple of pixels
+TIMELINE_WIDTH_PX = 6 * DPI
+# x axis labels per timeline, however many points it has
+MAX_TICKS = 8
+
+
+def bound_ticks(ax, dates=False):
+    """at most MAX_TICKS x labels: dates get concise auto ticks, label axes (the
+    monthly 'March-2024' strings) every n-th label"""
+    if dates:
+        locator = mdates.AutoDateLocator(maxticks=MAX_TICKS)
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    else:
+        ax.xaxis.set_major_locator(MaxNLocator(nbins=MAX_TICKS, integer=True))
+
+
+# each renderer takes the data chart_data() prepared and returns a matplotlib Figure.
+# they use Figure directly instead of pyplot so they are safe off the main thread.
+
+def _stats_chart(stats):
+    fig = Figure(figsize=(5, 3))
+    ax = fig.subplots()
+    ax.bar(['Messages', 'Words', 'Media', 'Links'], stats, color=['#7c3aed','#2563eb','#22c55e','#f59e0b'])
+    ax.set_title('Message Statistics')
+    return fig
+
+def _monthly_chart(tl):
+    fig = Figure(figsize=(6, 3.2))
+    ax = fig.subplots()
+    ax.plot(tl['time'], tl['message'], color='#2563eb')
+    ax.set_title('Monthly Timeline')
+    bound_ticks(ax)
+    ax.tick_params(axis='x', labelrotation=60)
+    return fig
+
+def _daily_chart(lod):
+    # days, or weeks / months when a long chat has more days than the chart has room for
+    freq, dl = lod
+    fig = Figure(figsize=(6, 3.2))
+    ax = fig.subplots()
+    ax.plot(dl['start'], dl['message'], color='#a78bfa')
+    ax.set_title(f"{timelines.FREQ_LABELS[freq]} Timeline")
+    bound_ticks(ax, dates=True)
+    return fig
+
+def _heatmap_chart(hm):
+    fig = Figure(figsize=(6, 3.2))
+    ax = fig.subplots()
+    sns.heatmap(hm, cmap='mako', ax=ax, cbar_kws={'label':'Messages'})
+    ax.set_title('Weekly Activity Heatmap')
+    return fig
+
+def _bar_chart(title, color, rotation):
+    def draw(counts):
+        fig = Figure(figsize=(5.5, 3.0))
+        ax = fig.subplots()
+        ax.bar(counts.index.astype(str), counts.values, color=color)
+        ax.set_title(title)
+        ax.tick_params(axis='x', labelrotation=rotation)
+        return fig
+    return draw
+
+def _emoji_chart(top_e):
+    fig = Figure(figsize=(5, 3.2))
+    ax = fig.subplots()
+    ax.barh(top_e['emoji'][::-1], top_e['count'][::-1], color='#60a5fa')
+    ax.set_title('Top Emojis')
+    return fig
+
+def _words_chart(mc_df):
+    fig = Figure(figsize=(5.5, 3.2))
+    ax = fig.subplots()
+    ax.barh(mc_df[0][::-1], mc_df[1][::-1], color='#22c55e')
+    ax.set_title('Most Common Words')
+    return fig
+
+def _wordcloud_chart(image):
+    fig = Figure(figsize=(6.5, 3.8))
+    ax = fig.subplots()
+    ax.imshow(image)
+    ax.axis('off')
+    ax.set_title('Word Cloud')
+    return fig
+
+CHARTS = {
+    'stats': _stats_chart,
+    'monthly': _monthly_chart,
+    'daily': _daily_chart,
+    'heatmap': _heatmap_chart,
+    'busy_day': _bar_chart('Most Busy Day', '#f59e0b', 45),
+    'busy_month': _bar_chart('Most Busy Month', '#38bdf8', 45),
+    'busy_users': _bar_chart('Most Active Participants', '#ef4444', 60),
+    'emojis': _emoji_chart,
+    'words': _words_chart,
+    'wordcloud': _wordcloud_chart,
+}
+
+
+def render_chart(kind, data):
+    """png bytes of one chart (top level so a process pool can run it)"""
+    fig = CHARTS[kind](data)
+    buf = BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight', dpi=DPI)
+    return buf.getvalue()
+
+
+def chart_data(analysis):
+    """[(kind, data)] for every chart the report shows, in report order; charts
+    with nothing to draw are left out"""
+    charts = [('stats', list(analysis.fetch_stats()))]
+
+    tl = analysis.monthly_timeline()
+    if tl is not None and not tl.empty:
+        charts.append(('monthly', tl))
+    lod = analysis.lod_timeline(TIMELINE_WIDTH_PX)
+    if not lod[1].empty:
+        charts.append(('daily', lod))
+    hm = analysis.activity_heatmap()
+    if hm is not None and not hm.empty:
+        charts.append(('heatmap', hm))
+    bd = analysis.week_activity_map()
+    if bd is not None and not getattr(bd, 'empty', False):
+        charts.append(('busy_day', bd))
+    bm = analysis.month_activity_map()
+    if bm is not None and not getattr(bm, 'empty', False):
+        charts.append(('busy_month', bm))
+
+    # Most active participants (Overall only)
+    if analysis.selected_user == 'Overall':
+        x, _ = analysis.most_busy_users()
+        if not x.empty:
+            charts.append(('busy_users', x))
+
+    e_df = analysis.emoji_helper()
+    if e_df is not None and not e_df.empty:
+        e_df = e_df.set_axis(['emoji','count'], axis=1)
+        charts.append(('emojis', e_df.head(10)))
+    mc_df = analysis.most_common_words()
+    if mc_df is not None and not mc_df.empty:
+        charts.append(('words', mc_df))
+    wc_img = analysis.create_wordcloud()
+    if wc_img is not None:
+        charts.append(('wordcloud', wc_img))
+    return charts
+
+
+def render_charts(charts, chat_key=None, selected_user=None, workers=None):
+    """{kind: png} for chart_data() output. cached pngs are reused when chat_key is
+    given; the rest are drawn in a process pool when workers > 1"""
+    pngs = {}
+    missing = []
+    with _png_lock:
+        for kind, data in charts:
+            key = (chat_key, selected_user, kind)
+            if chat_key is not None and key in _png_cache:
+                _png_cache.move_to_end(key)
+                pngs[kind] = _png_cache[key]
+            else:
+                missing.append((kind, data))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(missing))
+    if workers > 1:
+        # not a fork: the app builds reports inside the threaded streamlit server
+        context = pool_context('matplotlib.figure', 'seaborn', 'reportlab.platypus')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            rendered = list(pool.map(render_chart, *zip(*missing)))
+    else:
+        rendered = [render_chart(kind, data) for kind, data in missing]
+
+    for (kind, _), png in zip(missing, rendered):
+        pngs[kind] = png
+        if chat_key is not None:
+            with _png_lock:
+                _png_cache[(chat_key, selected_user, kind)] = png
+                while len(_png_cache) > MAX_CACHED_CHARTS:
+                    _png_cache.popitem(last=False)
+    return pngs
+
+
+# turn a rendered png into ReportLab image (so we can put charts into PDF)
+def png_to_flowable(png, max_width=480):
+    rl_img = RLImage(BytesIO(png))
+    # scale keeping aspect ratio
+    iw, ih = rl_img.drawWidth, rl_img.drawHeight
+    if iw > max_width:
+        scale = max_width / iw
+        rl_img.drawWidth = iw * scale
+        rl_img.drawHeight = ih * scale
+    return rl_img
+
+
+def build_report(analysis, chat_name='WhatsApp Chat', chat_key=None, workers=None):
+    """full pdf report of a ChatAnalysis as bytes; metrics the dashboard already
+    computed on the same analysis are reused.
+
+    pass chat_key (the upload hash) to reuse charts rendered for an earlier report.
+    """
+    selected_user = analysis.selected_user
+    filtered_df = analysis.rows()
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=36, rightMargin=36, topMargin=36, bottomMargin=36)
+    styles = getSampleStyleSheet()
+    title_style = styles['Title']
+    h_style = styles['Heading2']
+    body = styles['BodyText']
+
+    flow = []
+
+    # Cover Page
+    date_min = str(filtered_df['date'].min().date()) if not filtered_df.empty else '-'
+    date_max = str(filtered_df['date'].max().date()) if not filtered_df.empty else '-'
+    total_msgs = int(filtered_df.shape[0])
+
+    flow.append(Paragraph("CHATLYTICS Report", title_style))
+    flow.append(Spacer(1, 12))
+    flow.append(Paragraph(f"Chat: {chat_name}", body))
+    flow.append(Paragraph(f"Scope: {selected_user}", body))
+    flow.append(Paragraph(f"Date range: {date_min} to {date_max}", body))
+    flow.append(Paragraph(f"Total messages analyzed: {total_msgs}", body))
+    flow.append(Paragraph(f"Generated on: <u>{pd.Timestamp.now().strftime('%Y-%m-%d %H:%M')}</u>", body))
+    flow.append(PageBreak())
+
+    # Executive Summary (basic heuristics)
+    try:
+        busiest_day = filtered_df['day_name'].value_counts().idxmax() if not filtered_df.empty else '-'
+        busiest_user = filtered_df[filtered_df['user']!='group_notification']['user'].value_counts().idxmax() if not filtered_df.empty else '-'
+    except Exception:
+        busiest_day, busiest_user = '-', '-'
+    flow.append(Paragraph("Executive Summary", h_style))
+    flow.append(Paragraph(f"- Peak activity day: {busiest_day}", body))
+    flow.append(Paragraph(f"- Most frequent sender: {busiest_user}", body))
+    flow.append(Spacer(1, 12))
+
+    # Charts, in report order; the words chart closes its page
+    charts = chart_data(analysis)
+    pngs = render_charts(charts, chat_key, selected_user, workers)
+    for kind, _ in charts:
+        flow.append(png_to_flowable(pngs[kind]))
+        flow.append(PageBreak() if kind == 'words' else Spacer(1, 6))
+
+    # Appendix: Basic tables
+    num_messages, words_count, num_media_messages, num_links = analysis.fetch_stats()
+    flow.append(Paragraph('Appendix: Summary Tables', h_style))
+    # Summary metrics table
+    metrics_data = [
+        ['Metric', 'Value'],
+        ['Total Messages', str(total_msgs)],
+        ['Total Words', str(words_count)],
+        ['Media Messages', str(num_media_messages)],
+        ['Links Shared', str(num_links)],
+    ]
+    t = Table(metrics_data, hAlign='LEFT')
+    t.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.grey),
+        ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
+        ('GRID', (0,0), (-1,-1), 0.5, colors.lightgrey),
+        ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+    ]))
+    flow.append(t)
+
+    doc.build(flow)
+    return buffer.getvalue()
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+from preprocessor import MONTH_NAMES
+
+# message counts per calendar bucket, counted with np.bincount over integer bucket
+# numbers instead of grouping on date objects or label strings.
+#   D: days since 1970-01-01          W: weeks since then, starting on Monday
+#   M: months since 1970-01           Q: quarters since then
+FREQS = ('D', 'W', 'M', 'Q')
+
+# day ordinal numpy gives NaT
+NAT_DAY = np.datetime64('NaT', 'D').astype('int64')
+
+
+def day_ordinals(dates):
+    """days since 1970-01-01 of every date, as int64 (NAT_DAY where there is none)"""
+    return dates.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype('int64')
+
+
+def bucket_ordinals(days, freq):
+    """bucket number of each day ordinal"""
+    if freq not in FREQS:
+        raise ValueError(f"unknown timeline frequency: {freq}, expected one of {', '.join(FREQS)}")
+    if freq == 'D':
+        return days
+    if freq == 'W':
+        # 1970-01-01 was a thursday, so shift by 3 days to start weeks on monday
+        return (days + 3) // 7
+    months = days.astype('datetime64[D]').astype('datetime64[M]').astype('int64')
+    if freq == 'M':
+        return months
+    return months // 3
+
+
+def bucket_starts(buckets, freq):
+    """first day of each bucket, as datetime64[ns]"""
+    if freq == 'D':
+        starts = buckets.astype('datetime64[D]')
+    elif freq == 'W':
+        starts = (buckets * 7 - 3).astype('datetime64[D]')
+    elif freq == 'M':
+        starts = buckets.astype('datetime64[M]')
+    else:
+        starts = (buckets * 3).astype('datetime64[M]')
+    return starts.astype('datetime64[ns]')
+
+
+def bucket_labels(buckets, freq):
+    """axis labels: 2024-03-18 (days, weeks), March-2024 (months), Q1-2024 (quarters)"""
+    if freq in ('D', 'W'):
+        return np.datetime_as_string(bucket_starts(buckets, freq), unit='D').astype(object)
+    if freq == 'M':
+        names = np.array(MONTH_NAMES, dtype=object)[buckets % 12]
+        years = (buckets // 12 + 1970).astype(str).astype(object)
+        return names + '-' + years
+    quarters = ('Q' + (buckets % 4 + 1).astype(str)).astype(object)
+    return quarters + '-' + (buckets // 4 + 1970).astype(str).astype(object)
+
+
+def count_timeline(days, freq='D', fill=True):
+    """messages per bucket from day ordinals: columns bucket, start, time (label) and
+    message. fill=True also lists the empty buckets between the first and the last"""
+    buckets = bucket_ordinals(days[days != NAT_DAY], freq)
+    if len(buckets):
+        first = buckets.min()
+        counts = np.bincount(buckets - first)
+        buckets = np.arange(first, first + len(counts))
+        if not fill:
+            buckets, counts = buckets[counts > 0], counts[counts > 0]
+    else:
+        counts = np.zeros(0, dtype='int64')
+    return pd.DataFrame({
+        'bucket': buckets,
+        'start': bucket_starts(buckets, freq),
+        'time': bucket_labels(buckets, freq),
+        'message': counts.astype('int64'),
+    })
+
+
+def monthly_layout(timeline):
+    """monthly count_timeline() in the helper.monthly_timeline layout: year,
+    month_num, month, message, time"""
+    buckets = timeline['bucket'].to_numpy()
+    return pd.DataFrame({
+        'year': buckets // 12 + 1970,
+        'month_num': buckets % 12 + 1,
+        'month': np.array(MONTH_NAMES, dtype=object)[buckets % 12],
+        'message': timeline['message'].to_numpy(),
+        'time': timeline['time'].to_numpy(),
+    })
+
+
+def daily_layout(timeline):
+    """daily count_timeline() in the helper.daily_timeline layout: only_date, message"""
+    return pd.DataFrame({'only_date': timeline['start'].to_numpy(), 'message': timeline['message'].to_numpy()})
+
+
+# level of detail: a chart gets at most one point per POINT_PX pixels of its width
+POINT_PX = 2
+FREQ_LABELS = {'D': 'Daily', 'W': 'Weekly', 'M': 'Monthly', 'Q': 'Quarterly'}
+
+
+def minmax_decimate(timeline, max_points):
+    """at most max_points rows of a timeline: it is cut into max_points / 2 equal
+    stretches and the lowest and the highest row of each are kept, so peaks and
+    quiet spells survive the thinning"""
+    n = len(timeline)
+    if n <= max_points:
+        return timeline
+    size = -(-n // max(max_points // 2, 1))
+    stretches = -(-n // size)
+    # pad to a full rectangle with nan; the last stretch keeps at least one real value
+    counts = np.full(stretches * size, np.nan)
+    counts[:n] = timeline['message'].to_numpy()
+    counts = counts.reshape(stretches, size)
+    firsts = np.arange(stretches) * size
+    keep = np.union1d(firsts + np.nanargmin(counts, axis=1), firsts + np.nanargmax(counts, axis=1))
+    return timeline.iloc[keep].reset_index(drop=True)
+
+
+def lod_timeline(days, width_px, fill=True):
+    """(freq, timeline) for a chart width_px wide: the finest of days, weeks and
+    months that fits, min/max decimated when even the months do not"""
+    max_points = max(width_px // POINT_PX, 2)
+    for freq in ('D', 'W', 'M'):
+        timeline = count_timeline(days, freq, fill)
+        if len(timeline) <= max_points:
+            return freq, timeline
+    return freq, minmax_decimate(timeline, max_points)
@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+import benchmark
+import helper
+import parse_cache
+import preprocessor
+from analytics_index import AnalyticsIndex, OVERALL, open_chat, save_chat
+
+
+@pytest.fixture(scope='module')
+def chat(tmp_path_factory):
+    path = tmp_path_factory.mktemp('chat') / 'chat.txt'
+    benchmark.generate_chat(path, 3_000, users=5, seed=2)
+    return preprocessor.preprocess_file(path, compact=True)
+
+
+def test_readers_never_see_tail_only_counters(chat, monkeypatch):
+    # an index reopened with the counters of its first rows, shared by two threads
+    first = AnalyticsIndex(chat.iloc[:2_000])
+    first.fetch_stats(OVERALL)
+    first.emoji_frequencies(OVERALL)
+    index = AnalyticsIndex(chat, state=first.state(), state_rows=2_000)
+    full = AnalyticsIndex(chat)
+
+    merge = helper.merge_frequencies
+
+    def slow_merge(counts, more):
+        time.sleep(0.2)
+        return merge(counts, more)
+
+    monkeypatch.setattr(helper, 'merge_frequencies', slow_merge)
+    results = {}
+
+    def read(name):
+        results[name] = (index.word_frequencies(OVERALL).sum(), index.emoji_frequencies(OVERALL).sum())
+
+    threads = [threading.Thread(target=read, args=(n,)) for n in range(2)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+    expected = (full.word_frequencies(OVERALL).sum(), full.emoji_frequencies(OVERALL).sum())
+    assert results == {0: expected, 1: expected}
+    state = index.state()
+    assert state['terms'].sum() == full.state()['terms'].sum()
+    assert state['emojis'].sum() == full.state()['emojis'].sum()
+
+
+def test_save_chat_writes_only_new_counters(tmp_path, monkeypatch):
+    monkeypatch.setattr(parse_cache, 'CACHE_DIR', tmp_path / 'cache')
+    path = tmp_path / 'chat.txt'
+    benchmark.generate_chat(path, 500, users=3, seed=4)
+    index = open_chat(path, compact=True)
+    index.fetch_stats(OVERALL)
+    save_chat(index)
+
+    written = []
+    store_state = parse_cache.store_state
+    monkeypatch.setattr(parse_cache, 'store_state',
+                        lambda key, state, rows: written.append(set(state)) or store_state(key, state, rows))
+    index.emoji_frequencies(OVERALL)
+    save_chat(index)
+    save_chat(index)
+    assert written == [{'emojis'}]
+
+    reopened = open_chat(path, compact=True)
+    assert reopened.saved == set(index.state())
+    assert reopened.fetch_stats(OVERALL) == index.fetch_stats(OVERALL)
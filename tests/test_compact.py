@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+
+import benchmark
+import helper
+import preprocessor
+
+METRICS = ['fetch_stats', 'monthly_timeline', 'daily_timeline', 'week_activity_map',
+           'month_activity_map', 'activity_heatmap', 'most_common_words', 'emoji_helper',
+           'time_activity_user_grid']
+
+
+@pytest.fixture(scope='module')
+def layouts(tmp_path_factory):
+    path = tmp_path_factory.mktemp('chat') / 'chat.txt'
+    benchmark.generate_chat(path, 3_000, users=5, seed=1)
+    # one bad stamp, so the nullable int / 'Unknown' period paths are in too
+    text = path.read_text(encoding='utf-8') + "99/99/2024, 10:00 - Rohan: bad date\n"
+    return preprocessor.preprocess(text), preprocessor.preprocess(text, compact=True)
+
+
+def plain(value):
+    # the same data with the layout's dtypes dropped
+    if isinstance(value, pd.Series):
+        return {str(k): v for k, v in value.items()}
+    if isinstance(value, pd.DataFrame):
+        return {str(col): plain(value[col]) for col in value.columns}
+    if isinstance(value, tuple):
+        return tuple(plain(v) for v in value)
+    return value
+
+
+def test_compact_layout_is_smaller(layouts):
+    df, compact = layouts
+    before = df.memory_usage(deep=True).sum()
+    after = compact.memory_usage(deep=True).sum()
+    # about half on this chat (53% when written); less means the schema regressed
+    saved = 1 - after / before
+    assert saved >= 0.45, f"compact layout saves {saved:.0%}: {before:,} -> {after:,} bytes"
+    assert len(compact) == len(df)
+
+
+@pytest.mark.parametrize('user', ['Overall', 'Rohan'])
+@pytest.mark.parametrize('name', METRICS)
+def test_helpers_match_on_both_layouts(layouts, user, name):
+    df, compact = layouts
+    assert plain(getattr(helper, name)(user, compact)) == plain(getattr(helper, name)(user, df))
+
+
+def test_most_busy_users_match_on_both_layouts(layouts):
+    df, compact = layouts
+    assert plain(helper.most_busy_users(compact)) == plain(helper.most_busy_users(df))
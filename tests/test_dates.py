@@ -0,0 +1,42 @@
+import pandas as pd
+import pytest
+
+import parse_cache
+import preprocessor
+
+
+def parse(stamps):
+    return preprocessor.parse_dates(pd.Series(stamps, dtype=str))[0].tolist()
+
+
+def test_month_first_and_12h():
+    assert parse(['[1/13/21, 9:05:01 PM]', '[1/14/21, 12:00:00 AM]']) == [
+        pd.Timestamp('2021-01-13 21:05:01'), pd.Timestamp('2021-01-14 00:00:00')]
+
+
+def test_one_bad_stamp_only_loses_itself():
+    assert parse(['12/01/2024, 10:00 - ', '13/01/2024, 10:00 - ', '99/99/2024, 10:00 - ']) == [
+        pd.Timestamp('2024-01-12 10:00'), pd.Timestamp('2024-01-13 10:00'), pd.NaT]
+
+
+def test_mixed_layouts_parse_loosely():
+    assert parse(['5/1/24, 10:00 - ', '12/01/2024, 10:00 - ', '13/01/2024, 11:00 - ']) == [
+        pd.Timestamp('2024-01-05 10:00'), pd.Timestamp('2024-01-12 10:00'), pd.Timestamp('2024-01-13 11:00')]
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_incremental_parse_keeps_month_first(tmp_path, monkeypatch, compact):
+    monkeypatch.setattr(parse_cache, 'CACHE_DIR', tmp_path / 'cache')
+    base = ''.join(f"12/{d}/23, 10:{d:02} - Rohan: hi {d}\n" for d in range(13, 29))
+    # every date of the tail also fits day first
+    tail = ''.join(f"1/{d}/24, 11:{d:02} - Priya: yo {d}\n" for d in range(2, 10))
+    (tmp_path / 'old.txt').write_text(base, encoding='utf-8')
+    (tmp_path / 'new.txt').write_text(base + tail, encoding='utf-8')
+
+    parse_cache.cached_preprocess_file(tmp_path / 'old.txt', compact=compact)
+    incremental = parse_cache.cached_preprocess_file(tmp_path / 'new.txt', compact=compact)
+    full = preprocessor.preprocess_file(tmp_path / 'new.txt', compact=compact)
+
+    assert parse_cache.find_base(tmp_path / 'new.txt', compact) is not None
+    assert incremental['date'].tolist() == full['date'].tolist()
+    assert incremental['date'].iloc[-1] == pd.Timestamp('2024-01-09 11:09')
@@ -0,0 +1,82 @@
+from collections import Counter
+
+import pandas as pd
+
+import helper
+
+
+def test_tokenize_counts_words_and_terms_from_one_split():
+    df = pd.DataFrame({
+        'user': ['Rohan', 'Priya', 'Rohan', 'group_notification', 'Priya', 'Rohan'],
+        'message': ['Chalo  KAL milte', '<Media omitted>', '   ', 'Rohan added Priya',
+                    'kal\nparty ÇA', 'Straße straße'],
+    })
+    counts, terms = helper.tokenize(df)
+    # word counts cover every message, case and kind aside
+    assert counts.tolist() == [3, 2, 0, 3, 3, 2]
+    assert counts.tolist() == helper.word_counts(df['message']).tolist()
+
+    stop = helper.load_stop_words()
+    expected = Counter((user, word) for user, message in zip(df['user'], df['message'])
+                       if user != 'group_notification' and not message.startswith('<Media omitted>')
+                       for word in message.lower().split() if word not in stop)
+    assert dict(terms) == dict(expected)
+    assert terms.equals(helper.term_frequencies(df))
+
+
+def chat_frame():
+    rows = [
+        ('2024-01-01 10:00', 'Rohan', 'hi'),
+        # same user again: not a reply
+        ('2024-01-01 10:05', 'Rohan', 'anyone?'),
+        (None, 'Priya', 'undated'),
+        ('2024-01-01 10:10', 'group_notification', 'Rohan added Amit'),
+        # exactly SESSION_GAP after Rohan's last message: same conversation
+        ('2024-01-01 10:35', 'Priya', 'here'),
+        # one minute over: a new conversation, not a reply
+        ('2024-01-01 11:06', 'Amit', 'hello'),
+        ('2024-01-01 11:10', 'Rohan', 'hey Amit'),
+        ('2024-01-02 09:00', 'Priya', 'morning'),
+        ('2024-01-02 09:02', 'Rohan', 'morning'),
+    ]
+    return pd.DataFrame({
+        'date': pd.to_datetime([r[0] for r in rows]),
+        'user': [r[1] for r in rows],
+        'message': [r[2] for r in rows],
+    })
+
+
+def test_conversation_frame_rules():
+    conv = helper.conversation_frame(chat_frame())
+    assert conv['user'].tolist() == ['Rohan', 'Rohan', 'Priya', 'Amit', 'Rohan', 'Priya', 'Rohan']
+    assert conv['reply'].tolist() == [False, False, True, False, True, False, True]
+    assert conv['session'].tolist() == [1, 1, 1, 2, 2, 3, 3]
+    assert conv['first_of_day'].tolist() == [True, False, False, False, False, True, False]
+    assert conv.loc[2, 'gap'] == helper.SESSION_GAP
+
+
+def test_reply_metrics():
+    conv = helper.conversation_frame(chat_frame())
+    latency = helper.reply_latency('Overall', conv)
+    assert latency.to_dict('list') == {'user': ['Rohan', 'Priya'], 'replies': [2, 1],
+                                       'median_minutes': [3.0, 30.0]}
+    assert helper.median_reply_minutes('Overall', conv) == 4.0
+    assert helper.median_reply_minutes('Amit', conv) is None
+
+    edges = helper.reply_edges('Overall', conv)
+    assert sorted(map(tuple, edges.to_numpy().tolist())) == [
+        ('Priya', 'Rohan', 1), ('Rohan', 'Amit', 1), ('Rohan', 'Priya', 1)]
+    assert helper.reply_edges('Amit', conv).to_numpy().tolist() == [['Rohan', 'Amit', 1]]
+
+
+def test_sessions_and_day_initiators():
+    conv = helper.conversation_frame(chat_frame())
+    sessions = helper.conversation_sessions('Overall', conv)
+    assert sessions['messages'].tolist() == [3, 2, 2]
+    assert sessions['participants'].tolist() == [2, 2, 2]
+    assert sessions['initiator'].tolist() == ['Rohan', 'Amit', 'Priya']
+    assert sessions['minutes'].tolist() == [35.0, 4.0, 2.0]
+    assert helper.conversation_sessions('Amit', conv)['initiator'].tolist() == ['Amit']
+
+    assert helper.day_initiators('Overall', conv).to_dict() == {'Rohan': 1, 'Priya': 1}
+    assert helper.day_initiators('Amit', conv).empty
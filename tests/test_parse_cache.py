@@ -0,0 +1,39 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import parse_cache
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(parse_cache, 'CACHE_DIR', tmp_path)
+    return tmp_path
+
+
+def test_entry_files_do_not_share_a_temp_file(cache_dir):
+    df = pd.DataFrame({'user': ['Rohan', 'Priya']})
+    parse_cache.store('abc', df, {'size': 10})
+    assert parse_cache.load('abc').equals(df)
+    assert parse_cache.load_manifest('abc') == {'size': 10}
+    assert not list(cache_dir.glob('*.tmp'))
+
+
+def test_evict_drops_stale_temp_files_only(cache_dir):
+    stale = cache_dir / 'abc-v3.parquet.x1.tmp'
+    fresh = cache_dir / 'abc-v3.json.x2.tmp'
+    stale.write_text('half')
+    fresh.write_text('half')
+    old = time.time() - parse_cache.STALE_TMP_SECONDS - 60
+    os.utime(stale, (old, old))
+    parse_cache.evict()
+    assert not stale.exists() and fresh.exists()
+
+
+def test_store_state_keeps_the_cache_under_its_limit(cache_dir, monkeypatch):
+    parse_cache.store('abc', pd.DataFrame({'user': ['Rohan'] * 1000}))
+    monkeypatch.setattr(parse_cache, 'MAX_CACHE_BYTES', 1)
+    parse_cache.store_state('abc', {'words': pd.Series([1, 2, 3])}, rows=1000)
+    assert not list(cache_dir.iterdir())
@@ -0,0 +1,113 @@
+import re
+
+import pandas as pd
+import pytest
+
+import benchmark
+import preprocessor
+
+
+def old_split(bodies):
+    """the per-row loop split_user_messages replaced, kept as the reference. the
+    am/pm strip is now done by the timestamp patterns, so no body starts with one"""
+    users = []
+    messages = []
+    for message in bodies:
+        message = re.sub(r'^(?i:(?:am|pm))\s*-\s*', '', message.strip())
+        user_message = None
+        match1 = re.match(r'^([^:]+):\s(.+)$', message, re.DOTALL)
+        if match1:
+            user_message = (match1.group(1).strip(), match1.group(2).strip())
+        if not user_message:
+            match2 = re.match(r'^\[.*?\]\s*([^:]+):\s(.+)$', message, re.DOTALL)
+            if match2:
+                user_message = (match2.group(1).strip(), match2.group(2).strip())
+        if not user_message:
+            match3 = re.match(r'^.*?-\s*([^:]+):\s(.+)$', message, re.DOTALL)
+            if match3:
+                user_message = (match3.group(1).strip(), match3.group(2).strip())
+        if not user_message:
+            colon_pos = message.find(':')
+            if colon_pos > 0:
+                potential_user = message[:colon_pos].strip()
+                potential_message = message[colon_pos+1:].strip()
+                if len(potential_user) < 50 and not re.search(r'[^\w\s\-\.]', potential_user):
+                    user_message = (potential_user, potential_message)
+        if user_message:
+            users.append(user_message[0])
+            messages.append(user_message[1])
+        else:
+            users.append('group_notification')
+            messages.append(message.strip())
+    return users, messages
+
+
+BODIES = [
+    # plain
+    'Rohan: hi there\n',
+    'Amit Kumar:  spaced out  ',
+    # bracket
+    '[12/01/2024, 10:00:00] Priya: bracketed',
+    '[note] Priya:no space after colon',
+    # dash
+    'forwarded - Sneha: dashed',
+    'a - b - Rahul: two dashes',
+    '- Rahul: leading dash',
+    # bare colon
+    'Vikram:no space',
+    'Vikram Singh.Jr-2:x',
+    'Rohan:',
+    'Rohan: ',
+    'Rohan :',
+    'weird!name:text',
+    ':starts with colon',
+    # names of 49, 50 and more chars
+    'a' * 49 + ':bare',
+    'a' * 50 + ':bare',
+    'a' * 80 + ':bare',
+    'a' * 80 + ': spaced',
+    # multi-line
+    'Pooja: line one\nline two\n\nline four',
+    'Pooja:\nstarts on the next line',
+    'Pooja: time is 10:30\nok: sure',
+    # notifications
+    'Rohan added Priya',
+    'Messages and calls are end-to-end encrypted. No one outside of this chat can read them.',
+    'Sneha changed the subject from "a: b" to "c"',
+    '~ Neha joined using this group\'s invite link',
+    '',
+    '   ',
+    # media / emoji / url
+    'Karan: <Media omitted>',
+    'Divya: 😂😂 👍🏽',
+    'Meera: https://youtu.be/x?t=1:20',
+    '😂: emoji name',
+]
+
+
+@pytest.mark.parametrize('body', BODIES)
+def test_split_matches_old_loop(body):
+    users, messages = preprocessor.split_user_messages(pd.Series([body], dtype=str))
+    assert (users.tolist(), messages.tolist()) == old_split([body])
+
+
+@pytest.mark.parametrize('fmt', range(len(preprocessor.patterns)))
+def test_split_matches_old_loop_on_a_generated_chat(tmp_path, fmt):
+    path = tmp_path / 'chat.txt'
+    benchmark.generate_chat(path, 2_000, fmt=fmt, seed=3)
+    with open(path, encoding='utf-8') as f:
+        bodies = [body for _, body in preprocessor.iter_messages(f, fmt)]
+    users, messages = preprocessor.split_user_messages(pd.Series(bodies, dtype=str))
+    assert (users.tolist(), messages.tolist()) == old_split(bodies)
+
+
+@pytest.mark.parametrize('fmt', range(len(preprocessor.patterns)))
+def test_parallel_parse_matches_serial(tmp_path, monkeypatch, fmt):
+    path = tmp_path / 'chat.txt'
+    # the generated chats carry multi-line messages, so chunk bounds must respect them
+    benchmark.generate_chat(path, 3_000, fmt=fmt, seed=5)
+    text = path.read_text(encoding='utf-8')
+    serial = preprocessor.preprocess(text)
+    monkeypatch.setattr(preprocessor, 'PARALLEL_MIN_SIZE', 1)
+    assert preprocessor.preprocess(text, workers=2).equals(serial)
+    assert preprocessor.preprocess_file(path, workers=2).equals(serial)